@@ -0,0 +1,54 @@
+"""قياس كلفة الاتصال لكل استعلام: اتصال جديد لكل استعلام مقابل الاتصال الدائم في ConnectionPool
+
+    python benchmarks/bench_db_conn.py [عدد_الاستعلامات]
+"""
+import os
+import sys
+import sqlite3
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from main import ConnectionPool  # noqa: E402
+
+QUERY = "SELECT id, name FROM department_types WHERE id = ?"
+
+
+def make_database(path):
+    cnx = sqlite3.connect(path)
+    cnx.execute("CREATE TABLE department_types (id INTEGER PRIMARY KEY, name TEXT)")
+    cnx.executemany("INSERT INTO department_types (name) VALUES (?)", [(f"قسم {i}",) for i in range(100)])
+    cnx.commit()
+    cnx.close()
+
+
+def connect_per_query(path, n):
+    # السلوك السابق لـ DB_conn._get_connection
+    for i in range(n):
+        cnx = sqlite3.connect(path)
+        cnx.execute("PRAGMA foreign_keys = ON")
+        cnx.execute(QUERY, (i % 100 + 1,)).fetchall()
+        cnx.close()
+
+
+def pooled(path, n):
+    pool = ConnectionPool(path)
+    for i in range(n):
+        pool.get().execute(QUERY, (i % 100 + 1,)).fetchall()
+    pool.close_all()
+
+
+def main(n=5000):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        make_database(path)
+        for label, func in (("connect-per-query", connect_per_query), ("pooled", pooled)):
+            start = time.perf_counter()
+            func(path, n)
+            elapsed = time.perf_counter() - start
+            print(f"{label:<18} {n} queries: {elapsed:.3f}s  ({elapsed / n * 1e6:.1f} us/query)")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5000)
@@ -0,0 +1,73 @@
+"""قياس زمن إنشاء ملفات PDF للموظفين (reports.render_dossiers):
+
+- تشكيل النص العربي بدون ذاكرة مؤقتة (reshape + bidi لكل نص)
+- مع ذاكرة التشكيل، في نفس العملية
+- مع ذاكرة التشكيل، على ProcessPoolExecutor
+
+    python benchmarks/bench_dossiers.py [عدد_الملفات]
+"""
+import os
+import sys
+import random
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import reports  # noqa: E402
+
+NAMES = ["أحمد", "محمد", "فاطمة", "مريم", "يوسف", "خالد", "نورة", "سارة", "عبدالله", "إبراهيم"]
+DEPARTMENTS = ["الموارد البشرية", "المالية", "المشاريع", "تقنية المعلومات", "المشتريات"]
+JOBS = ["مهندس", "محاسب", "سائق", "فني", "مشرف", "عامل"]
+
+
+def make_dossiers(n):
+    return [
+        {
+            "id": i, "general_number": 1000 + i,
+            "name_ar": f"{random.choice(NAMES)} {random.choice(NAMES)}", "name_en": f"Emp {i}",
+            "department": random.choice(DEPARTMENTS), "job_title": random.choice(JOBS),
+            "birth_date": "1990-01-01", "national_id": f"NID{i:08d}", "id_issue_date": "2020-01-01",
+            "id_expiry_date": "2030-01-01", "phone": f"05{i:08d}", "iban_number": f"SA{i:022d}",
+            "photo_path": None,
+            "passports": [
+                {
+                    "passport_number": f"P{i:07d}", "passport_type": "عادي", "issue_date": "2021-05-01",
+                    "expiry_date": "2031-05-01", "issue_authority": "الجوازات", "custodian": "الشركة",
+                    "visas": [
+                        {"visa_number": f"V{i:07d}{v}", "visa_type": "عمل", "issue_date": "2022-01-01",
+                         "expiry_date": "2024-01-01"}
+                        for v in range(2)
+                    ],
+                }
+            ],
+        }
+        for i in range(n)
+    ]
+
+
+def timed(dossiers, **kwargs):
+    with tempfile.TemporaryDirectory() as tmp:
+        start = time.perf_counter()
+        reports.render_dossiers(dossiers, tmp, **kwargs)
+        return time.perf_counter() - start
+
+
+def main(n=300):
+    random.seed(1)
+    dossiers = make_dossiers(n)
+    reports.register_fonts()
+
+    cached = reports.shaper
+    reports.shaper = reports.TextShaper(maxsize=0)
+    results = {"no shaping cache": timed(dossiers, workers=1)}
+    reports.shaper = cached
+    results["cached, in-process"] = timed(dossiers, workers=1)
+    results[f"cached, {os.cpu_count()} processes"] = timed(dossiers)
+
+    for label, elapsed in results.items():
+        print(f"{n} dossiers  {label:<22} {elapsed:6.2f}s  ({elapsed / n * 1000:.1f} ms/dossier)")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 300)
@@ -0,0 +1,81 @@
+"""قياس إنتاجية الكتابة والقراءة لكل إعداد PRAGMA في DB_conn.PRAGMA_PROFILES:
+
+- كتابات صغيرة بـ commit لكل صف (كما تفعل نوافذ الإضافة والتعديل)
+- قراءات نقطية بالمفتاح ومسح كامل مع فرز
+- قراءات من خيط ثانٍ أثناء الكتابة (القرّاء مقابل الكاتب)
+
+    python benchmarks/bench_profiles.py [عدد_العمليات]
+"""
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from main import DB_conn  # noqa: E402
+
+INSERT = "INSERT INTO employees (general_number, name_ar, name_en, national_id, phone) VALUES (?, ?, ?, ?, ?)"
+
+
+def writes(db, n):
+    for i in range(n):
+        db.execute_query(INSERT, [100000 + i, f"موظف {i}", f"Emp {i}", f"NID{i:08d}", f"05{i:08d}"])
+
+
+def point_reads(db, n):
+    for i in range(n):
+        db.fetch_one("SELECT * FROM employees WHERE id = ?", [i % 1000 + 1])
+
+
+def scans(db, n):
+    for _ in range(n):
+        db.fetch_all("SELECT id, name_ar FROM employees ORDER BY name_ar, phone")
+
+
+def writes_with_reader(db, n):
+    """كتابات في الخيط الرئيسي بينما يقرأ خيط آخر باستمرار؛ يعيد عدد القراءات المنجزة"""
+    done = threading.Event()
+    reads = [0]
+
+    def reader():
+        while not done.is_set():
+            db.fetch_all("SELECT COUNT(*) FROM employees")
+            reads[0] += 1
+        db.pool.release()
+
+    thread = threading.Thread(target=reader)
+    thread.start()
+    writes(db, n)
+    done.set()
+    thread.join()
+    return reads[0]
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+def main(n=2000):
+    for profile in DB_conn.PRAGMA_PROFILES:
+        with tempfile.TemporaryDirectory() as tmp:
+            db = DB_conn(os.path.join(tmp, "bench.db"), profile=profile)
+            results = [
+                ("commit per row", n, timed(writes, db, n)[0]),
+                ("point reads", n * 5, timed(point_reads, db, n * 5)[0]),
+                ("sorted scans", 50, timed(scans, db, 50)[0]),
+            ]
+            elapsed, reads = timed(writes_with_reader, db, n)
+            results.append(("writes + reader", n, elapsed))
+            db.close()
+
+        for label, ops, elapsed in results:
+            print(f"{profile:<12} {label:<16} {ops / elapsed:10.0f} ops/s")
+        print(f"{profile:<12} {'reader reads':<16} {reads / elapsed:10.0f} ops/s  (while writing)")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
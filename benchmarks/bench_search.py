@@ -0,0 +1,84 @@
+"""قياس زمن بحث الموظفين بالنص عند 10k و100k صف:
+
+- pandas apply(axis=1) على خمسة أعمدة (الطريقة القديمة في filter_by_text)
+- LIKE على الأعمدة الخمسة في SQL
+- LIKE واحد على العمود المُجمَّع employees.search_text
+
+    python benchmarks/bench_search.py [عدد_الصفوف ...]
+"""
+import os
+import sys
+import random
+import tempfile
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from main import DB_conn  # noqa: E402
+
+NAMES = ["أحمد", "محمد", "فاطمة", "مريم", "يوسف", "خالد", "نورة", "سارة", "عبدالله", "إبراهيم"]
+COLUMNS = ["general_number", "name_ar", "name_en", "national_id", "phone"]
+TERMS = ["أحمد", "emp 12", "0555", "nid00099", "غير موجود"]
+
+
+def make_database(path, rows):
+    db = DB_conn(path)  # مخطط كامل بعد الترقيات: search_text والـ triggers
+    cnx = db.pool.get()
+    cnx.executemany(
+        "INSERT INTO employees (general_number, name_ar, name_en, national_id, phone) VALUES (?, ?, ?, ?, ?)",
+        [
+            (1000 + i, f"{random.choice(NAMES)} {random.choice(NAMES)}", f"Emp {i}", f"NID{i:08d}", f"05{i:08d}")
+            for i in range(rows)
+        ]
+    )
+    cnx.commit()
+    return db
+
+
+def pandas_apply(df, term):
+    term = term.lower()
+    return df[df.apply(lambda row: any(term in str(row[col]).lower() for col in COLUMNS), axis=1)]
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    for term in TERMS:
+        func(*args, term)
+    return (time.perf_counter() - start) / len(TERMS) * 1000
+
+
+def main(sizes):
+    random.seed(1)
+    for rows in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "bench.db")
+            db = make_database(path, rows)
+            cnx = db.pool.get()
+            df = pd.read_sql_query(f"SELECT {', '.join(COLUMNS)} FROM employees", cnx)
+
+            five_columns = " OR ".join(
+                f"{col} LIKE ?" for col in ["CAST(general_number AS TEXT)"] + COLUMNS[1:]
+            )
+            results = {
+                "pandas apply": timed(pandas_apply, df),
+                "LIKE x5 columns": timed(
+                    lambda term: cnx.execute(
+                        f"SELECT COUNT(*) FROM employees WHERE {five_columns}", [f"%{term}%"] * 5
+                    ).fetchone()
+                ),
+                "search_text LIKE": timed(
+                    lambda term: cnx.execute(
+                        "SELECT COUNT(*) FROM employees WHERE search_text LIKE ?", [f"%{term}%"]
+                    ).fetchone()
+                ),
+            }
+            db.close()
+
+        for label, ms in results.items():
+            print(f"{rows:>7} rows  {label:<18} {ms:9.2f} ms/search")
+
+
+if __name__ == '__main__':
+    main([int(n) for n in sys.argv[1:]] or [10_000, 100_000])
@@ -0,0 +1,56 @@
+"""قياس كلفة تشكيل النص العربي (arabic_reshaper + bidi) لقيم 10k موظف:
+
+- استدعاء reshape + get_display لكل قيمة (بدون ذاكرة)
+- reports.TextShaper.shape_many مع ذاكرة LRU
+
+    python benchmarks/bench_shaping.py [عدد_الموظفين]
+"""
+import os
+import sys
+import random
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from reports import TextShaper  # noqa: E402
+
+NAMES = ["أحمد", "محمد", "فاطمة", "مريم", "يوسف", "خالد", "نورة", "سارة", "عبدالله", "إبراهيم"]
+DEPARTMENTS = ["الموارد البشرية", "المالية", "المشاريع", "تقنية المعلومات", "المشتريات"]
+JOBS = ["مهندس", "محاسب", "سائق", "فني", "مشرف", "عامل"]
+PASSPORT_TYPES = ["عادي", "دبلوماسي", "خاص"]
+
+
+def make_values(n):
+    values = []
+    for i in range(n):
+        values += [
+            f"{random.choice(NAMES)} {random.choice(NAMES)} {random.choice(NAMES)}",
+            random.choice(DEPARTMENTS), random.choice(JOBS), random.choice(PASSPORT_TYPES),
+            f"NID{i:08d}", f"05{i:08d}", "2030-01-01",
+        ]
+    return values
+
+
+def main(n=10_000):
+    random.seed(1)
+    values = make_values(n)
+
+    start = time.perf_counter()
+    for value in values:
+        TextShaper._reshape(value)
+    uncached = time.perf_counter() - start
+
+    shaper = TextShaper()
+    start = time.perf_counter()
+    shaper.shape_many(values)
+    cached = time.perf_counter() - start
+
+    stats = shaper.stats()
+    print(f"{len(values)} values  no cache     {uncached:6.3f}s")
+    print(f"{len(values)} values  TextShaper   {cached:6.3f}s  ({uncached / cached:.0f}x)")
+    print(f"cache: {stats['hits']} hits, {stats['misses']} misses, {stats['hit_rate']:.1%} hit rate, "
+          f"{stats['size']} entries")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10_000)
@@ -0,0 +1,10 @@
+"""نقطة دخول البرنامج: عمليات ملفات PDF تعيد استيراد هذا الملف (spawn على ويندوز)،
+فلا يستورد الواجهة (main: PyQt5 وpandas) إلا بعد freeze_support في العملية الرئيسية.
+"""
+import multiprocessing
+
+
+if __name__ == '__main__':
+    multiprocessing.freeze_support()
+    import main
+    main.run()
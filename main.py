@@ -8,24 +8,327 @@
 
 import os
 import sys
+import csv
 import shlex
 import shutil
 import subprocess
 import sqlite3
 import logging
+import math
+import multiprocessing
+import threading
+import time
 import pandas as pd
-from datetime import datetime
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
 from hijridate import Gregorian
 from PyQt5 import QtCore, QtGui, QtWidgets
 from PyQt5.QtWidgets import QFileDialog, QMessageBox
 
+import reports
 from MainWindow import Ui_MainWindow
 from EditEmployeePage import Ui_EditEmployeeDialog
 
 
+# أشكال الألف والهمزة، التاء المربوطة، الألف المقصورة، التشكيل والتطويل
+ARABIC_NORMALIZATION = str.maketrans({
+    'أ': 'ا', 'إ': 'ا', 'آ': 'ا', 'ٱ': 'ا',
+    'ة': 'ه',
+    'ى': 'ي',
+    'ـ': None, '\u0670': None,
+    **{chr(code): None for code in range(0x064B, 0x0653)},
+})
+
+
+def normalize_arabic(text):
+    """مفتاح بحث موحَّد: يُطبَّق على نص البحث، ويقابله sql_normalize_arabic عند الكتابة"""
+    if text is None:
+        return None
+    return str(text).translate(ARABIC_NORMALIZATION).lower()
+
+
+def sql_normalize_arabic(expr):
+    """normalize_arabic كتعبير SQL بالدوال المدمجة replace وlower، فلا تحتاج triggers المخطط دالة يسجلها التطبيق"""
+    for code, replacement in ARABIC_NORMALIZATION.items():
+        replacement = f"char({ord(replacement)})" if replacement else "''"
+        expr = f"replace({expr}, char({code}), {replacement})"
+    return f"lower({expr})"
+
+
+class ConnectionPool:
+    """اتصالات SQLite طويلة العمر: اتصال واحد لكل خيط تُطبَّق عليه إعدادات PRAGMA مرة واحدة"""
+    def __init__(self, database, pragmas=None):
+        self.database = database
+        self.pragmas = pragmas or {'foreign_keys': 'ON'}
+        self._connections = {}
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        cnx = sqlite3.connect(self.database, check_same_thread=False)
+        for name, value in self.pragmas.items():
+            cnx.execute(f"PRAGMA {name} = {value}")
+        return cnx
+
+    def get(self):
+        thread = threading.current_thread()
+        with self._lock:
+            cnx = self._connections.get(thread)
+            if cnx is None:
+                self._prune()
+                cnx = self._connections[thread] = self._connect()
+        return cnx
+
+    def recycle(self, cnx):
+        """إغلاق اتصال معطوب ليُفتح اتصال جديد عند الطلب التالي"""
+        with self._lock:
+            for thread, conn in list(self._connections.items()):
+                if conn is cnx:
+                    del self._connections[thread]
+        try:
+            cnx.close()
+        except sqlite3.Error:
+            pass
+
+    def release(self):
+        """إغلاق اتصال الخيط الحالي (للخيوط الخلفية عند انتهاء عملها)"""
+        with self._lock:
+            cnx = self._connections.pop(threading.current_thread(), None)
+        if cnx is not None:
+            cnx.close()
+
+    def close_all(self):
+        with self._lock:
+            connections = list(self._connections.values())
+            self._connections.clear()
+        for cnx in connections:
+            cnx.close()
+
+    def _prune(self):
+        # اتصالات الخيوط المنتهية لم يعد لها مالك
+        for thread in [t for t in self._connections if not t.is_alive()]:
+            self._connections.pop(thread).close()
+
+
+class SchemaMigrator:
+    """ترقيات مخطط مرقّمة في PRAGMA user_version، تضيف فقط ولا تُعدَّل بعد نشرها؛ فهارس FTS5 خارجها (ensure_fts)"""
+    MIGRATIONS = [
+        (1, 'hot-path indexes', '_add_indexes'),
+        (2, 'employees.search_text', '_add_search_text'),
+        (3, 'passports custody search', '_add_passport_search'),
+        (4, 'ISO dates', '_normalize_dates'),
+    ]
+
+    # فهارس الاستعلامات المتكررة: الربط بين الجداول، التنبيهات حسب تاريخ الانتهاء، العهدة، والاستيراد
+    INDEXES = [
+        "CREATE INDEX IF NOT EXISTS idx_employees_general_number ON employees(general_number)",
+        "CREATE INDEX IF NOT EXISTS idx_employees_department ON employees(department_id)",
+        "CREATE INDEX IF NOT EXISTS idx_employees_job_title ON employees(job_title_id)",
+        "CREATE INDEX IF NOT EXISTS idx_passports_employee ON passports(employee_id)",
+        "CREATE INDEX IF NOT EXISTS idx_passports_number ON passports(passport_number)",
+        "CREATE INDEX IF NOT EXISTS idx_passports_expiry ON passports(expiry_date)",
+        "CREATE INDEX IF NOT EXISTS idx_passports_custodian ON passports(custodian, received_at)",
+        "CREATE INDEX IF NOT EXISTS idx_visas_passport ON visas(passport_id)",
+        "CREATE INDEX IF NOT EXISTS idx_visas_number ON visas(visa_number)",
+        "CREATE INDEX IF NOT EXISTS idx_visas_expiry ON visas(expiry_date)",
+        "CREATE INDEX IF NOT EXISTS idx_visas_type_passport ON visas(visa_type_id, passport_id)",
+        "CREATE INDEX IF NOT EXISTS idx_handover_passport ON handover(passport_id)",
+    ]
+
+    # عمود نصي مُجمَّع وموحَّد للبحث يحدَّث بالـ triggers، فيصبح البحث LIKE واحدًا لكل صف
+    SEARCH_TEXT_EXPR = sql_normalize_arabic("""
+        coalesce(CAST({row}.general_number AS TEXT), '') || char(10) || coalesce({row}.name_ar, '') || char(10) ||
+        coalesce({row}.name_en, '') || char(10) || coalesce({row}.national_id, '') || char(10) || coalesce({row}.phone, '')
+    """)
+
+    FTS_COLUMNS = ['general_number', 'name_ar', 'name_en', 'national_id', 'phone']
+    # أعمدة البحث في العهدة: الأصل -> العمود الموحَّد
+    PASSPORT_SEARCH_COLUMNS = {'delivered_by': 'delivered_by_search', 'received_by': 'received_by_search'}
+    # (الفهرس، الجدول، الأعمدة) التي يبنيها ensure_fts
+    FTS_INDEXES = [
+        ('employees_fts', 'employees', FTS_COLUMNS),
+        ('passports_fts', 'passports', list(PASSPORT_SEARCH_COLUMNS)),
+    ]
+
+    def __init__(self, pool):
+        self.pool = pool
+
+    @classmethod
+    def latest_version(cls):
+        return cls.MIGRATIONS[-1][0]
+
+    def current_version(self):
+        return self.pool.get().execute("PRAGMA user_version").fetchone()[0]
+
+    def migrate(self):
+        """تطبيق الترقيات الأحدث من إصدار قاعدة البيانات بالترتيب، والتوقف عند أول ترقية تفشل"""
+        cnx = self.pool.get()
+        version = self.current_version()
+        if version > self.latest_version():
+            logging.warning("Database schema v%s is newer than this application (v%s)", version, self.latest_version())
+            return version
+
+        for number, name, method in self.MIGRATIONS:
+            if number <= version:
+                continue
+            try:
+                # BEGIN IMMEDIATE: قفل الكتابة من البداية، وDDL في SQLite يُلغى بالكامل مع rollback
+                cnx.execute("BEGIN IMMEDIATE")
+                getattr(self, method)(cnx)
+                cnx.execute(f"PRAGMA user_version = {number}")
+                cnx.commit()
+            except Exception as err:
+                cnx.rollback()
+                logging.error("Schema migration %s (%s) failed: %s", number, name, err)
+                break
+            version = number
+            logging.info("Applied schema migration %s (%s)", number, name)
+        return version
+
+    def ensure_fts(self):
+        """بناء فهارس FTS_INDEXES الناقصة عند كل تشغيل؛ يرجع False (البحث بـ LIKE) إن لم تتوفر FTS5"""
+        cnx = self.pool.get()
+        existing = {row[0] for row in cnx.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        missing = [index for index in self.FTS_INDEXES if index[0] not in existing]
+        if not missing:
+            return True
+        try:
+            cnx.execute("BEGIN IMMEDIATE")
+            for fts, table, columns in missing:
+                self._create_fts(cnx, fts, table, columns)
+            cnx.commit()
+        except sqlite3.Error as err:
+            cnx.rollback()
+            logging.warning("FTS5 unavailable, falling back to LIKE search: %s", err)
+            return False
+        logging.info("Built full-text indexes: %s", ", ".join(index[0] for index in missing))
+        return True
+
+    def _add_indexes(self, cnx):
+        for statement in self.INDEXES:
+            cnx.execute(statement)
+
+    def _add_search_text(self, cnx):
+        columns = [row[1] for row in cnx.execute("PRAGMA table_info(employees)")]
+        if 'search_text' not in columns:
+            cnx.execute("ALTER TABLE employees ADD COLUMN search_text TEXT")
+        for name, event in (
+            ('employees_search_text_insert', 'INSERT'),
+            ('employees_search_text_update', 'UPDATE OF general_number, name_ar, name_en, national_id, phone'),
+        ):
+            cnx.execute(f"DROP TRIGGER IF EXISTS {name}")
+            cnx.execute(f"""
+                CREATE TRIGGER {name} AFTER {event} ON employees
+                BEGIN
+                    UPDATE employees SET search_text = {self.SEARCH_TEXT_EXPR.format(row='new')} WHERE id = new.id;
+                END
+            """)
+        cnx.execute(f"UPDATE employees SET search_text = {self.SEARCH_TEXT_EXPR.format(row='employees')}")
+
+    def _create_fts(self, cnx, fts, table, columns):
+        """(إعادة) إنشاء فهرس FTS5 للجدول table مع triggers المزامنة؛ يرفع OperationalError دون FTS5"""
+        cols = ", ".join(columns)
+        new_cols = ", ".join(sql_normalize_arabic(f"new.{col}") for col in columns)
+        self._drop_fts(cnx, fts)
+        # الفهرس يخزن القيم الموحَّدة، لذلك لا يكون external content على الجدول الأصلي
+        cnx.execute(f"""
+            CREATE VIRTUAL TABLE {fts} USING fts5(
+                {cols}, tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+            )
+        """)
+        cnx.execute(f"""
+            INSERT INTO {fts}(rowid, {cols})
+            SELECT id, {", ".join(sql_normalize_arabic(col) for col in columns)} FROM {table}
+        """)
+        cnx.execute(f"""
+            CREATE TRIGGER {fts}_insert AFTER INSERT ON {table} BEGIN
+                INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new_cols});
+            END
+        """)
+        cnx.execute(f"""
+            CREATE TRIGGER {fts}_delete AFTER DELETE ON {table} BEGIN
+                DELETE FROM {fts} WHERE rowid = old.id;
+            END
+        """)
+        cnx.execute(f"""
+            CREATE TRIGGER {fts}_update AFTER UPDATE OF {cols} ON {table} BEGIN
+                DELETE FROM {fts} WHERE rowid = old.id;
+                INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new_cols});
+            END
+        """)
+
+    def _drop_fts(self, cnx, fts):
+        for trigger in (f'{fts}_insert', f'{fts}_delete', f'{fts}_update'):
+            cnx.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+        cnx.execute(f"DROP TABLE IF EXISTS {fts}")
+
+    # أعمدة التاريخ التي تقارن كنص في الاستعلامات (التنبيهات حسب تاريخ الانتهاء)
+    DATE_COLUMNS = {
+        'employees': ['birth_date', 'id_issue_date', 'id_expiry_date'],
+        'passports': ['issue_date', 'expiry_date'],
+        'visas': ['issue_date', 'expiry_date'],
+    }
+
+    def _normalize_dates(self, cnx):
+        """تحويل التواريخ المخزنة بصيغة غير yyyy-MM-dd (من استيراد قديم) إلى هذه الصيغة إن أمكن دون لبس"""
+        iso = "GLOB '[0-9][0-9][0-9][0-9]-[0-1][0-9]-[0-3][0-9]'"
+        for table, columns in self.DATE_COLUMNS.items():
+            for column in columns:
+                rows = cnx.execute(
+                    f"SELECT id, {column} FROM {table} WHERE {column} <> '' AND NOT {column} {iso}"
+                ).fetchall()
+                updates = [(iso_date(value), id_) for id_, value in rows if iso_date(value) != value]
+                cnx.executemany(f"UPDATE {table} SET {column} = ? WHERE id = ?", updates)
+
+    def _add_passport_search(self, cnx):
+        """أعمدة موحَّدة لـ delivered_by وreceived_by تحدّثها الـ triggers (وفهرسها passports_fts في ensure_fts)"""
+        existing = [row[1] for row in cnx.execute("PRAGMA table_info(passports)")]
+        for column in self.PASSPORT_SEARCH_COLUMNS.values():
+            if column not in existing:
+                cnx.execute(f"ALTER TABLE passports ADD COLUMN {column} TEXT")
+        assignments = ", ".join(
+            f"{shadow} = {sql_normalize_arabic(f'{{row}}.{column}')}"
+            for column, shadow in self.PASSPORT_SEARCH_COLUMNS.items()
+        )
+        for name, event in (
+            ('passports_search_insert', 'INSERT'),
+            ('passports_search_update', 'UPDATE OF delivered_by, received_by'),
+        ):
+            cnx.execute(f"DROP TRIGGER IF EXISTS {name}")
+            cnx.execute(f"""
+                CREATE TRIGGER {name} AFTER {event} ON passports
+                BEGIN
+                    UPDATE passports SET {assignments.format(row='new')} WHERE id = new.id;
+                END
+            """)
+        cnx.execute(f"UPDATE passports SET {assignments.format(row='passports')}")
+
+
 class DB_conn:
-    def __init__(self, database='db\\employees.db'):
+    # إعدادات PRAGMA لكل اتصال:
+    # safe: افتراضيات SQLite (journal حذف، fsync كامل مع كل commit، ذاكرة تخزين صغيرة)
+    # performance: WAL (القرّاء لا يحجبون الكاتب)، synchronous=NORMAL (fsync عند الـ checkpoint فقط)،
+    #              ذاكرة صفحات 64MB، mmap 256MB، والجداول المؤقتة للفرز والتجميع في الذاكرة
+    PRAGMA_PROFILES = {
+        'safe': {
+            'foreign_keys': 'ON',
+            'journal_mode': 'DELETE',
+            'synchronous': 'FULL',
+        },
+        'performance': {
+            'foreign_keys': 'ON',
+            'journal_mode': 'WAL',
+            'synchronous': 'NORMAL',
+            'cache_size': -64000,
+            'mmap_size': 268435456,
+            'temp_store': 'MEMORY',
+        },
+    }
+
+    def __init__(self, database='db\\employees.db', profile='performance'):
         self.database = database
+        self.profile = profile
+        self.pool = ConnectionPool(database, pragmas=self.PRAGMA_PROFILES[profile])
         self.switch_cols = {
             'department_types': ['id', 'name'],
             'job_titles': ['id', 'name'],
@@ -49,13 +352,104 @@ class DB_conn:
         }
 
         if not os.path.exists(self.database):
-            os.makedirs(os.path.dirname(self.database), exist_ok=True)
+            if os.path.dirname(self.database):
+                os.makedirs(os.path.dirname(self.database), exist_ok=True)
             self.init_db()
+        migrator = SchemaMigrator(self.pool)
+        self.schema_version = migrator.migrate()
+        self.has_fts = migrator.ensure_fts()
+        # بدائل LIKE تحتاج الأعمدة الموحَّدة؛ إن توقفت الترقيات قبلها يكون البحث على الأعمدة الأصلية
+        self.has_search_text = self.schema_version >= 2
+        self.has_custody_search = self.schema_version >= 3
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS department_types (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL UNIQUE
+        );
+        CREATE TABLE IF NOT EXISTS job_titles (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL UNIQUE
+        );
+        CREATE TABLE IF NOT EXISTS passport_types (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL UNIQUE
+        );
+        CREATE TABLE IF NOT EXISTS visa_types (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL UNIQUE
+        );
+        CREATE TABLE IF NOT EXISTS employees (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            general_number INTEGER NOT NULL,
+            name_ar TEXT,
+            name_en TEXT,
+            birth_date TEXT,
+            national_id TEXT,
+            id_issue_date TEXT,
+            id_expiry_date TEXT,
+            department_id INTEGER REFERENCES department_types(id) ON DELETE SET NULL,
+            job_title_id INTEGER REFERENCES job_titles(id) ON DELETE SET NULL,
+            phone TEXT,
+            iban_number TEXT,
+            role TEXT,
+            photo_path TEXT,
+            docs_path TEXT
+        );
+        CREATE TABLE IF NOT EXISTS passports (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            employee_id INTEGER NOT NULL REFERENCES employees(id) ON DELETE CASCADE,
+            passport_number TEXT NOT NULL,
+            passport_type_id INTEGER REFERENCES passport_types(id) ON DELETE SET NULL,
+            issue_date TEXT,
+            expiry_date TEXT,
+            issue_authority TEXT,
+            delivered_by TEXT,
+            received_by TEXT,
+            received_at TEXT,
+            custodian TEXT DEFAULT 'الشركة',
+            doc_path TEXT
+        );
+        CREATE TABLE IF NOT EXISTS visas (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            passport_id INTEGER NOT NULL REFERENCES passports(id) ON DELETE CASCADE,
+            visa_number TEXT NOT NULL,
+            visa_type_id INTEGER REFERENCES visa_types(id) ON DELETE SET NULL,
+            issue_date TEXT,
+            expiry_date TEXT,
+            doc_path TEXT
+        );
+        CREATE TABLE IF NOT EXISTS user (
+            id INTEGER PRIMARY KEY,
+            username TEXT NOT NULL,
+            password TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS handover (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            passport_id INTEGER REFERENCES passports(id) ON DELETE CASCADE,
+            employee_id INTEGER REFERENCES employees(id) ON DELETE CASCADE,
+            action_type TEXT,
+            action_at TEXT
+        );
+    """
+
+    def init_db(self):
+        """إنشاء قاعدة بيانات جديدة: الجداول فقط، والفهارس وغيرها عبر الترقيات"""
+        self._get_connection().executescript(self.SCHEMA)
 
     def _get_connection(self):
-        cnx = sqlite3.connect(self.database)
-        cnx.execute("PRAGMA foreign_keys = ON")
-        return cnx
+        return self.pool.get()
+
+    def close(self):
+        self.pool.close_all()
+
+    def checkpoint(self, mode='PASSIVE'):
+        """نقل صفحات ملف WAL إلى قاعدة البيانات حتى لا يكبر الملف ولا تبطؤ القراءة (لا أثر له خارج WAL)"""
+        try:
+            busy, log_pages, done = self._get_connection().execute(f"PRAGMA wal_checkpoint({mode})").fetchone()
+            logging.debug("WAL checkpoint %s: %s/%s pages (busy=%s)", mode, done, log_pages, busy)
+        except sqlite3.Error as err:
+            logging.warning("WAL checkpoint failed: %s", err)
 
     def execute_query(self, query, data=None, fetch=False, return_id=False):
         cnx = self._get_connection()
@@ -67,18 +461,57 @@ class DB_conn:
                 cur.execute(query)
 
             if fetch or query.strip().lower().startswith('select'):
-                df = pd.read_sql_query(query, cnx, params=data)
-                return df
+                # بناء الـ DataFrame من نفس المؤشر بدل تنفيذ الاستعلام مرة ثانية
+                columns = [col[0] for col in cur.description or []]
+                return pd.DataFrame.from_records(cur.fetchall(), columns=columns, coerce_float=True)
 
             cnx.commit()
             if return_id:
                 return cur.lastrowid
             return "تمت العملية بنجاح"
         except Exception as err:
+            self._rollback(cnx)
             return f"حدث خطأ: {str(err)}"
         finally:
             cur.close()
-            cnx.close()
+
+    def fetch_all(self, query, data=None):
+        """قراءة بتنفيذ واحد: قائمة صفوف sqlite3.Row (الوصول بالاسم row['col'])؛ ترفع sqlite3.Error عند الفشل"""
+        cnx = self._get_connection()
+        cur = cnx.cursor()
+        cur.row_factory = sqlite3.Row
+        try:
+            cur.execute(query, data or [])
+            return cur.fetchall()
+        except sqlite3.Error as err:
+            logging.error("Query failed: %s", err)
+            self._rollback(cnx)
+            raise
+        finally:
+            cur.close()
+
+    def fetch_one(self, query, data=None):
+        rows = self.fetch_all(query, data)
+        return rows[0] if rows else None
+
+    @contextmanager
+    def transaction(self):
+        """معاملة على اتصال الخيط الحالي: commit عند الخروج وrollback عند أي استثناء (داخلها cnx لا execute_query)"""
+        cnx = self._get_connection()
+        cnx.execute("BEGIN IMMEDIATE")
+        try:
+            yield cnx
+            cnx.commit()
+        except BaseException:
+            self._rollback(cnx)
+            raise
+
+    def _rollback(self, cnx):
+        # الاتصال دائم، لذا يجب ألا تبقى معاملة فاشلة مفتوحة عليه
+        try:
+            cnx.rollback()
+        except sqlite3.Error:
+            self.pool.recycle(cnx)
 
     def insert(self, table, data):
         if table not in self.switch_cols:
@@ -429,7 +862,7 @@ class PassportDialog(QtWidgets.QDialog):
             self.issue_authority.text(),
             self.delivered_by.text(),
             self.received_by.text(),
-            self.received_at.text(),
+            self.received_at.date().toString("yyyy-MM-dd"),
             self.passport_data.get("custodian", "الشركة"),# self.custodian.currentText(),
             doc_path
         ]
@@ -1191,85 +1624,241 @@ class CustodyViewer:
         self.table_company_custody.setColumnHidden(1, True)
         self.table_company_custody.setSelectionBehavior(QtWidgets.QTableWidget.SelectRows)
 
-    def load_custody_data(self):
-        start_date = self.dateEdit_from.date().toString("yyyy-MM-dd") + " 00:00:00"
-        end_date = self.dateEdit_to.date().toString("yyyy-MM-dd") + " 23:59:59"
-        query = """
-            SELECT p.id, p.employee_id, e.name_ar AS employee, 
-                   p.passport_number, pt.name AS passport_type,
-                   p.custodian, p.received_at, p.delivered_by, p.received_by
-            FROM passports p
-            LEFT JOIN employees e ON p.employee_id = e.id
-            LEFT JOIN passport_types pt ON p.passport_type_id = pt.id
-            ORDER BY p.received_at DESC
-        """
-        
-        df = self.db_conn.execute_query(query, fetch=True)
-        df = df.fillna("غير موجود")
+    CUSTODY_QUERY = """
+        SELECT p.id, p.employee_id, coalesce(e.name_ar, 'غير موجود') AS employee,
+               coalesce(p.passport_number, 'غير موجود') AS passport_number,
+               coalesce(pt.name, 'غير موجود') AS passport_type, p.received_at
+        FROM passports p
+        LEFT JOIN employees e ON p.employee_id = e.id
+        LEFT JOIN passport_types pt ON p.passport_type_id = pt.id
+        WHERE {where}
+        ORDER BY p.received_at DESC
+    """
 
-        if df is None or df.empty:
-            self.table_employee_custody.setRowCount(0)
-            self.table_company_custody.setRowCount(0)
+    def load_custody_data(self):
+        # التصفية في SQL على الفهرس (custodian, received_at)؛ الحد الأعلى اليوم التالي ليشمل القيم بوقت أو بدونه
+        start_date = self.dateEdit_from.date().toString("yyyy-MM-dd")
+        end_date = self.dateEdit_to.date().addDays(1).toString("yyyy-MM-dd")
+        try:
+            employee_rows = self.db_conn.fetch_all(
+                self.CUSTODY_QUERY.format(where="p.custodian = ? AND p.received_at >= ? AND p.received_at < ?"),
+                ["الموظف", start_date, end_date]
+            )
+            company_rows = self.db_conn.fetch_all(self.CUSTODY_QUERY.format(where="p.custodian = ?"), ["الشركة"])
+        except sqlite3.Error as err:
+            QtWidgets.QMessageBox.warning(self, "خطأ", f"فشل تحميل الجوازات: {err}")
             return
 
-        df_employee = df[df['custodian'] == "الموظف"].reset_index(drop=True)
-        df_company = df[df['custodian'] == "الشركة"].reset_index(drop=True)
-
-        df_employee["received_at"] = pd.to_datetime(df_employee["received_at"], errors="coerce")
-        
-        df_employee = df_employee[
-            (df_employee["received_at"] >= start_date) & (df_employee["received_at"] <= end_date)
-        ].reset_index(drop=True)
-
-        self.populate_table(self.table_employee_custody, df_employee, "received_at")
-        self.populate_table(self.table_company_custody, df_company)
+        self.populate_table(self.table_employee_custody, employee_rows, "received_at")
+        self.populate_table(self.table_company_custody, company_rows)
 
     @staticmethod
-    def populate_table(table, df, date_field=None):
-        table.setRowCount(len(df))
-        for i, row in df.iterrows():
+    def populate_table(table, rows, date_field=None):
+        table.setRowCount(len(rows))
+        for i, row in enumerate(rows):
             table.setItem(i, 0, QtWidgets.QTableWidgetItem(str(row['id'])))
             table.setItem(i, 1, QtWidgets.QTableWidgetItem(str(row['employee_id'])))
             table.setItem(i, 2, QtWidgets.QTableWidgetItem(str(row['employee'])))
             table.setItem(i, 3, QtWidgets.QTableWidgetItem(str(row['passport_number'])))
             table.setItem(i, 4, QtWidgets.QTableWidgetItem(str(row['passport_type'])))
             if date_field:
-                formatted_date = row[date_field].strftime("%Y-%m-%d") if pd.notna(row[date_field]) else ""
-                table.setItem(i, 5, QtWidgets.QTableWidgetItem(formatted_date))
+                table.setItem(i, 5, QtWidgets.QTableWidgetItem((row[date_field] or "")[:10]))
+
+
+def _clean_records(records, columns, first_index):
+    """دفعة استيراد: نصوص بلا مسافات زائدة، بلا صفوف فارغة، والفهرس = رقم صف الملف - 2"""
+    rows = [[_clean_value(value) for value in record] for record in records]
+    df = pd.DataFrame(rows, columns=columns, index=range(first_index, first_index + len(rows)), dtype=object)
+    return df.dropna(how="all")
+
+
+def _clean_value(value):
+    # قيم Python عادية تُمرَّر إلى sqlite3 كما هي: None بدل NaN/NaT/NA
+    if value is None or value is pd.NA or value is pd.NaT or (isinstance(value, float) and math.isnan(value)):
+        return None
+    if isinstance(value, str):
+        return value.strip()
+    if isinstance(value, date):
+        # خلايا التاريخ تُخزَّن بصيغة الواجهة yyyy-MM-dd (sqlite3 لا يقبل pandas.Timestamp)
+        return value.strftime("%Y-%m-%d")
+    return value
+
+
+# صيغ تاريخ تُحوَّل إلى yyyy-MM-dd دون لبس؛ dd/mm/yyyy وما شابهها تبقى كما هي (اليوم والشهر ملتبسان)
+# المسافة أو T قبل الوقت (T من to_json(date_format='iso') وغيره من مصادر JSON)
+ISO_DATE_FORMATS = [
+    "%Y-%m-%d", "%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%d %H:%M:%S.%f",
+    "%Y-%m-%dT%H:%M:%S", "%Y-%m-%dT%H:%M", "%Y-%m-%dT%H:%M:%S.%f", "%Y-%m-%dT%H:%M:%S%z", "%Y-%m-%dT%H:%M:%S.%f%z",
+    "%Y/%m/%d",
+]
+
+
+def iso_date(value):
+    """تاريخ نصي بصيغة yyyy-MM-dd (بأصفار) حتى تصح مقارنته كنص في SQL؛ القيم غير المعروفة تُعاد كما هي"""
+    if not isinstance(value, str):
+        return value
+    for fmt in ISO_DATE_FORMATS:
+        try:
+            return datetime.strptime(value, fmt).strftime("%Y-%m-%d")
+        except ValueError:
+            continue
+    return value
+
+
+def iso_dates(values):
+    """iso_date لعمود كامل: القيم التي بصيغة yyyy-MM-dd أصلًا لا تمر على strptime"""
+    other = values.notna() & ~values.astype(str).str.fullmatch(r"\d{4}-\d{2}-\d{2}")
+    if other.any():
+        values = values.copy()
+        values[other] = values[other].map(iso_date)
+    return values
+
+
+def _clean_frame(df, first_index):
+    return _clean_records(df.itertuples(index=False, name=None), df.columns, first_index)
+
+
+def read_xlsx_chunks(file_path, chunk_size):
+    """الورقة الأولى بـ openpyxl في وضع القراءة فقط، فلا تكبر الذاكرة مع حجم الملف"""
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = list(next(rows, ()))
+        width = len(header)
+        records, first_index = [], 0
+        for record in rows:
+            records.append(record[:width] + (None,) * (width - len(record)))
+            if len(records) == chunk_size:
+                yield _clean_records(records, header, first_index)
+                first_index += len(records)
+                records = []
+        if records or first_index == 0:
+            # ورقة بلا صفوف بيانات: إطار فارغ يحمل العناوين (انظر read_columns)
+            yield _clean_records(records, header, first_index)
+    finally:
+        workbook.close()
+
+
+def read_xls_chunks(file_path, chunk_size):
+    """ملفات xls القديمة: openpyxl لا يقرؤها، فتُقرأ كاملة بـ pandas ثم تُقسَّم"""
+    df = pd.read_excel(file_path)
+    for start in range(0, max(len(df), 1), chunk_size):
+        yield _clean_frame(df.iloc[start:start + chunk_size], start)
+
+
+def read_csv_chunks(file_path, chunk_size):
+    # كل القيم نصوص كما في الملف (الأصفار في بداية الهاتف والهوية تبقى)؛ utf-8-sig لملفات Excel المحفوظة CSV
+    first_index = 0
+    for df in pd.read_csv(file_path, dtype=str, encoding="utf-8-sig", chunksize=chunk_size):
+        yield _clean_frame(df, first_index)
+        first_index += len(df)
+
+
+def read_parquet_chunks(file_path, chunk_size):
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ValueError("قراءة ملفات Parquet تتطلب تثبيت الحزمة pyarrow") from None
+    parquet_file = pq.ParquetFile(file_path)
+    first_index = 0
+    for batch in parquet_file.iter_batches(batch_size=chunk_size):
+        df = batch.to_pandas()
+        yield _clean_frame(df, first_index)
+        first_index += len(df)
+    if first_index == 0:
+        yield _clean_frame(parquet_file.schema_arrow.empty_table().to_pandas(), 0)
+
+
+def read_jsonl_chunks(file_path, chunk_size):
+    """JSON Lines: كائن في كل سطر، مفاتيحه أسماء الأعمدة العربية"""
+    first_index = 0
+    with pd.read_json(file_path, lines=True, dtype=False, chunksize=chunk_size, encoding="utf-8") as reader:
+        for df in reader:
+            yield _clean_frame(df, first_index)
+            first_index += len(df)
+
+
+class TaskCancelled(Exception):
+    """تُرفع داخل مهمة خلفية عند طلب الإلغاء، فتُلغى معاملتها بالكامل"""
+
+
+class BackgroundTask(QtCore.QThread):
+    """تشغيل func(report, is_cancelled) خارج خيط الواجهة؛ بعد cancel() ترفع الدالة TaskCancelled"""
+    progress = QtCore.pyqtSignal(object)
+    succeeded = QtCore.pyqtSignal(object)
+    failed = QtCore.pyqtSignal(str)
+    cancelled = QtCore.pyqtSignal()
+
+    def __init__(self, func, db_conn=None, parent=None):
+        super().__init__(parent)
+        self.func = func
+        self.db_conn = db_conn
+        self._cancel = threading.Event()
+
+    def cancel(self):
+        self._cancel.set()
+
+    def is_cancelled(self):
+        return self._cancel.is_set()
+
+    def run(self):
+        try:
+            result = self.func(self.progress.emit, self.is_cancelled)
+        except TaskCancelled:
+            self.cancelled.emit()
+        except Exception as err:
+            logging.exception("Background task failed")
+            self.failed.emit(str(err))
+        else:
+            self.succeeded.emit(result)
+        finally:
+            if self.db_conn is not None:
+                # اتصال هذا الخيط لن يُستعمل بعد انتهائه
+                self.db_conn.pool.release()
 
 
 class EmployeeDataHandler:
     def __init__(self, db_conn):
         self.db_conn = db_conn
 
-    def _get_or_create(self, table, name):
-        """Ensure foreign key exists and return its ID."""
-        if pd.isna(name):
-            return None
-        name = str(name).strip()
-        # Check if exists
-        res = self.db_conn.execute_query(
-            f"SELECT id FROM {table} WHERE name = ?", (name,), fetch=True
-        )
-        if not res.empty:
-            return int(res.iloc[0]['id'])
-        # Insert new row
-        try:
-            new_id = int(self.db_conn.execute_query(
-                f"INSERT INTO {table} (name) VALUES (?)", (name,), return_id=True
-            ))
-            return new_id
-        except Exception as e:
-            logging.error("Failed to insert into %s: %s", table, e)
-            return None
+    # lookup table -> Excel column holding its names
+    LOOKUP_COLUMNS = {
+        "department_types": "القسم",
+        "job_titles": "المسمى_الوظيفي",
+        "passport_types": "نوع_الجواز",
+        "visa_types": "نوع_التأشيرة",
+    }
 
-    def export_selected_data(self, selected_ids):
-        """Returns a DataFrame of selected employees."""
-        if not selected_ids:
-            return None
+    @staticmethod
+    def _lookup_name(name):
+        return None if pd.isna(name) else str(name).strip()
+
+    def _load_lookups(self, cnx):
+        """Read every lookup table once into {table: {name: id}}."""
+        return {
+            table: {name: id_ for id_, name in cnx.execute(f"SELECT id, name FROM {table}")}
+            for table in self.LOOKUP_COLUMNS
+        }
 
-        placeholders = ",".join(["?"] * len(selected_ids))
-        query = f"""
+    def _add_new_lookups(self, cnx, chunk, known):
+        """Bulk-insert the names of this chunk that are not in the lookup tables yet."""
+        for table, column in self.LOOKUP_COLUMNS.items():
+            if column not in chunk:
+                continue
+            names = known[table]
+            new_names = {self._lookup_name(name) for name in chunk[column].dropna().unique()} - names.keys()
+            if not new_names:
+                continue
+            cnx.executemany(f"INSERT INTO {table} (name) VALUES (?)", [(name,) for name in new_names])
+            placeholders = ",".join(["?"] * len(new_names))
+            names.update(
+                (name, id_) for id_, name in
+                cnx.execute(f"SELECT id, name FROM {table} WHERE name IN ({placeholders})", list(new_names))
+            )
+
+    EXPORT_QUERY = """
         SELECT 
             e.general_number AS الرقم_العام, e.name_ar AS الاسم_بالعربي,
             e.name_en AS الاسم_بالانجليزي, j.name AS المسمى_الوظيفي,
@@ -1281,102 +1870,775 @@ class EmployeeDataHandler:
             v.visa_number AS رقم_التأشيرة, vt.name AS نوع_التأشيرة,
             v.issue_date AS تاريخ_بداية_التأشيرة, v.expiry_date AS تاريخ_نهاية_التأشيرة
         FROM employees e
+        {selection}
         LEFT JOIN department_types d ON e.department_id = d.id
         LEFT JOIN job_titles j ON e.job_title_id = j.id
         LEFT JOIN passports p ON e.id = p.employee_id
         LEFT JOIN passport_types pt ON p.passport_type_id = pt.id
         LEFT JOIN visas v ON p.id = v.passport_id
         LEFT JOIN visa_types vt ON v.visa_type_id = vt.id
-        WHERE e.id IN ({placeholders})
+        ORDER BY {order}, p.id, v.id
+    """
+    EXPORT_COUNT_QUERY = """
+        SELECT COUNT(*)
+        FROM employees e
+        {selection}
+        LEFT JOIN passports p ON e.id = p.employee_id
+        LEFT JOIN visas v ON p.id = v.passport_id
+    """
+    EXPORT_CHUNK_SIZE = 1000
+
+    def export_to_file(self, file_path, selected_ids=None, progress=None, is_cancelled=None):
+        """Stream employees (all, or selected_ids in order) to .xlsx/.csv and return the row count.
+
+        Written to a temp file that replaces file_path only on success; raises TaskCancelled when is_cancelled().
         """
-        return self.db_conn.execute_query(query, data=selected_ids, fetch=True)
+        cnx = self.db_conn.pool.get()
+        selection, order = "", "e.id"
+        if selected_ids is not None:
+            self._fill_export_ids(cnx, selected_ids)
+            selection, order = "JOIN temp.export_ids s ON s.id = e.id", "s.pos"
+
+        total = None
+        if progress:
+            total = cnx.execute(self.EXPORT_COUNT_QUERY.format(selection=selection)).fetchone()[0]
+
+        directory, name = os.path.split(file_path)
+        tmp_path = os.path.join(directory, f".{name}.part")
+        cur = cnx.cursor()
+        try:
+            cur.execute(self.EXPORT_QUERY.format(selection=selection, order=order))
+            columns = [col[0] for col in cur.description]
+            batches = self._export_batches(cur, total, progress, is_cancelled)
+            if file_path.lower().endswith(".csv"):
+                count = self._write_csv(tmp_path, columns, batches)
+            else:
+                count = self._write_xlsx(tmp_path, columns, batches)
+            if count:
+                os.replace(tmp_path, file_path)
+            return count
+        finally:
+            cur.close()
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _export_batches(self, cur, total, progress, is_cancelled):
+        rows = 0
+        while True:
+            if is_cancelled and is_cancelled():
+                raise TaskCancelled()
+            batch = cur.fetchmany(self.EXPORT_CHUNK_SIZE)
+            if not batch:
+                return
+            yield batch
+            rows += len(batch)
+            if progress:
+                progress({"rows": rows, "total": total})
+
+    @staticmethod
+    def _fill_export_ids(cnx, selected_ids):
+        """Selected ids in a connection-private temp table, numbered in selection order (joined instead of IN)."""
+        cnx.execute("CREATE TEMP TABLE IF NOT EXISTS export_ids (pos INTEGER PRIMARY KEY, id INTEGER NOT NULL UNIQUE)")
+        cnx.execute("DELETE FROM temp.export_ids")
+        cnx.executemany("INSERT OR IGNORE INTO temp.export_ids (id) VALUES (?)", ((int(i),) for i in selected_ids))
+        # الجدول المؤقت خاص بهذا الاتصال، والـ commit لا يبقي معاملة مفتوحة أثناء القراءة
+        cnx.commit()
+
+    @staticmethod
+    def _write_xlsx(file_path, columns, batches):
+        from openpyxl import Workbook
+
+        workbook = Workbook(write_only=True)
+        sheet = workbook.create_sheet()
+        sheet.append(columns)
+        count = 0
+        try:
+            for batch in batches:
+                for row in batch:
+                    sheet.append(row)
+                count += len(batch)
+        except BaseException:
+            # إنهاء ملف الورقة المؤقت الذي تكتبه openpyxl، فالمصنف لن يُحفظ
+            sheet.close()
+            raise
+        workbook.save(file_path)
+        return count
+
+    @staticmethod
+    def _write_csv(file_path, columns, batches):
+        count = 0
+        with open(file_path, "w", newline="", encoding="utf-8-sig") as f:
+            writer = csv.writer(f)
+            writer.writerow(columns)
+            for batch in batches:
+                writer.writerows(batch)
+                count += len(batch)
+        return count
+
+    DOSSIER_QUERIES = {
+        "employees": """
+            SELECT e.id, e.general_number, e.name_ar, e.name_en, d.name AS department, j.name AS job_title,
+                   e.birth_date, e.national_id, e.id_issue_date, e.id_expiry_date, e.phone, e.iban_number,
+                   e.photo_path
+            FROM employees e
+            JOIN temp.export_ids s ON s.id = e.id
+            LEFT JOIN department_types d ON e.department_id = d.id
+            LEFT JOIN job_titles j ON e.job_title_id = j.id
+            ORDER BY s.pos
+        """,
+        "passports": """
+            SELECT p.id, p.employee_id, p.passport_number, pt.name AS passport_type, p.issue_date,
+                   p.expiry_date, p.issue_authority, p.custodian
+            FROM passports p
+            JOIN temp.export_ids s ON s.id = p.employee_id
+            LEFT JOIN passport_types pt ON p.passport_type_id = pt.id
+            ORDER BY p.id
+        """,
+        "visas": """
+            SELECT v.passport_id, v.visa_number, vt.name AS visa_type, v.issue_date, v.expiry_date
+            FROM visas v
+            JOIN passports p ON p.id = v.passport_id
+            JOIN temp.export_ids s ON s.id = p.employee_id
+            LEFT JOIN visa_types vt ON v.visa_type_id = vt.id
+            ORDER BY v.id
+        """,
+    }
+
+    def fetch_dossiers(self, selected_ids):
+        """Employees in selection order as dicts for reports.render_dossier, with nested passports and visas."""
+        cnx = self.db_conn.pool.get()
+        self._fill_export_ids(cnx, selected_ids)
+
+        def rows(table):
+            cur = cnx.execute(self.DOSSIER_QUERIES[table])
+            columns = [col[0] for col in cur.description]
+            return [dict(zip(columns, row)) for row in cur]
+
+        dossiers = rows("employees")
+        by_employee = {dossier["id"]: dossier for dossier in dossiers}
+        for dossier in dossiers:
+            dossier["passports"] = []
+        by_passport = {}
+        for passport in rows("passports"):
+            passport["visas"] = []
+            by_passport[passport["id"]] = passport
+            by_employee[passport["employee_id"]]["passports"].append(passport)
+        for visa in rows("visas"):
+            by_passport[visa["passport_id"]]["visas"].append(visa)
+        return dossiers
+
+    def export_dossiers(self, out_dir, selected_ids, progress=None, is_cancelled=None):
+        """Render one PDF per selected employee into out_dir and return {"paths", "errors"}."""
+        dossiers = self.fetch_dossiers(selected_ids)
+        paths, errors = reports.render_dossiers(dossiers, out_dir, progress=progress, is_cancelled=is_cancelled)
+        if is_cancelled and is_cancelled():
+            for path in paths:
+                if os.path.exists(path):
+                    os.remove(path)
+            raise TaskCancelled()
+        return {"paths": paths, "errors": errors}
+
+    IMPORT_CHUNK_SIZE = 500
+
+    def import_data(self, file_path, progress=None, is_cancelled=None):
+        """Imports a file in READERS chunk by chunk in one transaction and returns a dict with status info."""
+        result = {"not_created": [], "errors": []}
+        started, rows = time.perf_counter(), 0
+        with self.db_conn.transaction() as cnx:
+            # lookup names and natural keys already in the database or written by this import
+            known = {**self._load_lookups(cnx), **{table: {} for table in self.KEY_COLUMNS}}
+            for chunk in self.read_chunks(file_path, self.IMPORT_CHUNK_SIZE):
+                if is_cancelled and is_cancelled():
+                    raise TaskCancelled()
+                self._import_chunk(cnx, chunk, known, result)
+                rows += len(chunk)
+                if progress:
+                    elapsed = time.perf_counter() - started
+                    progress({"rows": rows, "rate": rows / elapsed if elapsed else 0, "errors": len(result["errors"])})
+            if is_cancelled and is_cancelled():
+                raise TaskCancelled()
+        return result
+
+    # file extension -> reader(file_path, chunk_size) yielding DataFrames with the sheet's Arabic columns
+    READERS = {
+        ".xlsx": read_xlsx_chunks,
+        ".xlsm": read_xlsx_chunks,
+        ".xls": read_xls_chunks,
+        ".csv": read_csv_chunks,
+        ".parquet": read_parquet_chunks,
+        ".jsonl": read_jsonl_chunks,
+    }
+
+    @classmethod
+    def register_reader(cls, extension, reader):
+        """reader(file_path, chunk_size) yields cleaned DataFrames (one empty frame with the header if no rows)."""
+        cls.READERS[extension.lower()] = reader
+
+    @classmethod
+    def file_filter(cls):
+        """Filter string for QFileDialog covering every registered format."""
+        patterns = " ".join(f"*{ext}" for ext in cls.READERS)
+        return f"ملفات البيانات ({patterns});;ملفات Excel (*.xlsx *.xls);;CSV (*.csv);;Parquet (*.parquet);;JSON Lines (*.jsonl)"
+
+    @classmethod
+    def read_chunks(cls, file_path, chunk_size):
+        """Yield the file as cleaned DataFrames of at most chunk_size rows."""
+        extension = os.path.splitext(file_path)[1].lower()
+        reader = cls.READERS.get(extension)
+        if reader is None:
+            raise ValueError(f"صيغة الملف غير مدعومة: {extension or file_path}")
+        yield from reader(file_path, chunk_size)
+
+    @classmethod
+    def read_columns(cls, file_path):
+        """Header of the file ([] for an empty file in a format without a header)."""
+        first = next(iter(cls.read_chunks(file_path, 1)), None)
+        return [] if first is None else list(first.columns)
+
+    # table -> (natural key column, Excel column holding it)
+    KEY_COLUMNS = {
+        "employees": ("general_number", "الرقم_العام"),
+        "passports": ("passport_number", "رقم_الجواز"),
+        "visas": ("visa_number", "رقم_التأشيرة"),
+    }
 
-    def import_data(self, file_path):
-        """Imports data from Excel and returns a dict with status info."""
-        df = pd.read_excel(file_path)
-        obj_cols = df.select_dtypes(include="object").columns
-        df[obj_cols] = df[obj_cols].apply(lambda col: col.map(lambda x: x.strip() if isinstance(x, str) else x))
-        df = df.dropna(how="all")
+    @staticmethod
+    def _sheet_key(table, value):
+        """Natural key of a sheet cell as stored in the database (None if it cannot be one)."""
+        if pd.isna(value):
+            return None
+        if table == "employees":
+            try:
+                return int(value)
+            except (TypeError, ValueError):
+                return None
+        return str(value).split(".")[0]  # handle floats
 
-        not_created, errors = [], []
+    @staticmethod
+    def _sheet_keys(table, values):
+        """_sheet_key for a whole column at once (NA where a cell cannot be a key)."""
+        if table == "employees":
+            numbers = pd.to_numeric(values, errors="coerce")
+            return numbers.where(numbers % 1 == 0).astype("Int64")
+        return values.where(values.isna(), values.astype(str).str.split(".", n=1).str[0])
+
+    def _existing_keys(self, cnx, table, keys):
+        """{key: id} for the keys of table already in the database, in the sheet's key form."""
+        if not keys:
+            return {}
+        key_col = self.KEY_COLUMNS[table][0]
+        placeholders = ",".join(["?"] * len(keys))
+        return {
+            self._sheet_key(table, key): id_ for key, id_ in
+            cnx.execute(f"SELECT {key_col}, id FROM {table} WHERE {key_col} IN ({placeholders})", list(keys))
+        }
 
-        for idx, row in df.iterrows():
+    def _resolve_existing_keys(self, cnx, chunk, known):
+        """One IN query per table for the chunk's keys that are not known yet."""
+        for table, (_, column) in self.KEY_COLUMNS.items():
+            if column not in chunk:
+                continue
+            keys = {self._sheet_key(table, value) for value in chunk[column].dropna().unique()}
+            keys -= known[table].keys() | {None}
+            known[table].update(self._existing_keys(cnx, table, keys))
+
+    def _import_chunk(self, cnx, chunk, known, result):
+        for column in self.DATE_COLUMNS:
+            if column in chunk:
+                chunk[column] = iso_dates(chunk[column])
+        column = self.KEY_COLUMNS["employees"][1]
+        if column in chunk:
+            # same conversion as the validator, so both accept the same general numbers
+            chunk[column] = self._sheet_keys("employees", chunk[column])
+        self._add_new_lookups(cnx, chunk, known)
+        self._resolve_existing_keys(cnx, chunk, known)
+        visas = []  # (excel_row, params) inserted together with executemany at the end of the chunk
+
+        # dict per row: row.get() without the cost of building a Series for every row
+        for idx, row in zip(chunk.index, chunk.to_dict("records")):
+            cnx.execute("SAVEPOINT import_row")
             try:
-                dept_id = self._get_or_create("department_types", row.get("القسم"))
-                job_id = self._get_or_create("job_titles", row.get("المسمى_الوظيفي"))
-                passport_type_id = self._get_or_create("passport_types", row.get("نوع_الجواز"))
-                visa_type_id = self._get_or_create("visa_types", row.get("نوع_التأشيرة"))
-
-                if dept_id is None or job_id is None:
-                    not_created.append({"الرقم_العام": row.get("الرقم_العام"), "الاسم_بالعربي": row.get("الاسم_بالعربي")})
-                    continue
-
-                general_number = int(row.get("الرقم_العام"))
-                emp = self.db_conn.execute_query(
-                    "SELECT id FROM employees WHERE general_number = ?",
-                    (general_number,), fetch=True
+                added = self._import_row(cnx, row, known, result, visas, idx + 2)
+                cnx.execute("RELEASE import_row")
+            except Exception as row_err:
+                cnx.execute("ROLLBACK TO import_row")
+                cnx.execute("RELEASE import_row")
+                result["errors"].append(f"صف {idx+2}: {row_err}")
+                continue
+            # later rows of the sheet see this row's keys, so duplicates are detected in memory
+            for table, key, id_ in added:
+                known[table][key] = id_
+
+        if not visas:
+            return
+        cnx.execute("SAVEPOINT import_visas")
+        try:
+            cnx.executemany("""
+                INSERT INTO visas (passport_id, visa_number, visa_type_id, issue_date, expiry_date) VALUES (?, ?, ?, ?, ?)
+            """, [params for _, params in visas])
+            cnx.execute("RELEASE import_visas")
+        except sqlite3.Error:
+            # retry one by one to report the failing rows only
+            cnx.execute("ROLLBACK TO import_visas")
+            cnx.execute("RELEASE import_visas")
+            for excel_row, params in visas:
+                try:
+                    cnx.execute("""
+                        INSERT INTO visas (passport_id, visa_number, visa_type_id, issue_date, expiry_date) VALUES (?, ?, ?, ?, ?)
+                    """, params)
+                except sqlite3.Error as visa_err:
+                    result["errors"].append(f"صف {excel_row}: {visa_err}")
+
+    def _import_row(self, cnx, row, known, result, visas, excel_row):
+        """Write one sheet row and return the keys it added as (table, key, id)."""
+        added = []
+        dept_id, job_id, passport_type_id, visa_type_id = (
+            known[table].get(self._lookup_name(row.get(column)))
+            for table, column in self.LOOKUP_COLUMNS.items()
+        )
+
+        if dept_id is None or job_id is None:
+            result["not_created"].append({"الرقم_العام": row.get("الرقم_العام"), "الاسم_بالعربي": row.get("الاسم_بالعربي")})
+            return added
+
+        general_number = row.get("الرقم_العام")
+        if general_number is None:
+            raise ValueError("الرقم العام ليس رقمًا صحيحًا")
+        employee_id = known["employees"].get(general_number)
+
+        if employee_id is not None:
+            result["not_created"].append({"الرقم_العام": general_number, "الاسم_بالعربي": row.get("الاسم_بالعربي")})
+        else:
+            employee_id = cnx.execute("""
+                INSERT INTO employees (general_number, name_ar, name_en, birth_date,
+                                       national_id, id_issue_date, id_expiry_date,
+                                       department_id, job_title_id, phone, iban_number, role)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, (
+                general_number, row.get("الاسم_بالعربي"), row.get("الاسم_بالانجليزي"),
+                row.get("تاريخ_الميلاد"), row.get("رقم_بطاقة_الهوية"),
+                row.get("تاريخ_بداية_الهوية"), row.get("تاريخ_نهاية_الهوية"),
+                dept_id, job_id, row.get("رقم_الهاتف"), row.get("رقم_الايبان", ""), None
+            )).lastrowid
+            added.append(("employees", general_number, employee_id))
+
+        passport_number = self._sheet_key("passports", row.get("رقم_الجواز"))
+        passport_id = known["passports"].get(passport_number)
+        if passport_number is not None and passport_id is None and passport_type_id:
+            passport_id = cnx.execute("""
+                INSERT INTO passports (employee_id, passport_number, passport_type_id,
+                                       issue_date, expiry_date, custodian)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, (
+                int(employee_id), passport_number, int(passport_type_id),
+                row.get("تاريخ_بداية_الجواز"), row.get("تاريخ_نهاية_الجواز"), "الشركة"
+            )).lastrowid
+            added.append(("passports", passport_number, passport_id))
+
+        visa_number = self._sheet_key("visas", row.get("رقم_التأشيرة"))
+        if visa_number is not None and passport_id and visa_type_id and visa_number not in known["visas"]:
+            # the id is unknown until the chunk's executemany; only the key's presence matters
+            added.append(("visas", visa_number, None))
+            visas.append((excel_row, (
+                passport_id, visa_number, visa_type_id,
+                row.get("تاريخ_بداية_التأشيرة"), row.get("تاريخ_نهاية_التأشيرة")
+            )))
+        return added
+
+    # columns without which import_data skips the row (see not_created)
+    REQUIRED_COLUMNS = ["الرقم_العام", "القسم", "المسمى_الوظيفي"]
+    DATE_COLUMNS = [
+        "تاريخ_الميلاد", "تاريخ_بداية_الهوية", "تاريخ_نهاية_الهوية",
+        "تاريخ_بداية_الجواز", "تاريخ_نهاية_الجواز", "تاريخ_بداية_التأشيرة", "تاريخ_نهاية_التأشيرة",
+    ]
+
+    def validate_import(self, file_path, progress=None, is_cancelled=None):
+        """Dry run of import_data; returns {"rows", "errors", "warnings"} without writing anything."""
+        report = {"rows": 0, "errors": [], "warnings": []}
+        seen = {table: set() for table in self.KEY_COLUMNS}
+        cnx = self.db_conn.pool.get()
+        # العناوين مرة واحدة قبل قراءة الصفوف، فالنتيجة لا تتعلق بعدد الصفوف (ولا بملف بلا صفوف)
+        columns = self.read_columns(file_path)
+        for column in self.REQUIRED_COLUMNS:
+            if column not in columns:
+                report["errors"].append(
+                    {"row": None, "column": column, "value": None, "message": "العمود غير موجود في الملف"}
                 )
+        started = time.perf_counter()
+        for chunk in self.read_chunks(file_path, self.IMPORT_CHUNK_SIZE):
+            if is_cancelled and is_cancelled():
+                raise TaskCancelled()
+            self._validate_chunk(cnx, chunk, seen, report)
+            report["rows"] += len(chunk)
+            if progress:
+                elapsed = time.perf_counter() - started
+                progress({"rows": report["rows"], "rate": report["rows"] / elapsed if elapsed else 0,
+                          "errors": len(report["errors"])})
+        return report
+
+    def _validate_chunk(self, cnx, chunk, seen, report):
+        def add(kind, mask, column, message):
+            for idx, value in chunk.loc[mask, column].items():
+                report[kind].append({"row": idx + 2, "column": column, "value": value, "message": message})
+
+        for column in self.REQUIRED_COLUMNS:
+            if column in chunk:
+                add("errors", chunk[column].isna(), column, "حقل مطلوب فارغ")
+
+        column = self.KEY_COLUMNS["employees"][1]
+        if column in chunk:
+            invalid = chunk[column].notna() & self._sheet_keys("employees", chunk[column]).isna()
+            add("errors", invalid, column, "الرقم العام ليس رقمًا صحيحًا")
+
+        for column in self.DATE_COLUMNS:
+            if column in chunk:
+                values = chunk[column]
+                # نفس التحويل الذي يطبقه import_data قبل الكتابة
+                parsed = pd.to_datetime(iso_dates(values), format="%Y-%m-%d", errors="coerce")
+                add("errors", values.notna() & parsed.isna(), column, "تاريخ غير صالح (الصيغة المطلوبة yyyy-MM-dd)")
+
+        for table, (_, column) in self.KEY_COLUMNS.items():
+            if column not in chunk:
+                continue
+            keys = self._sheet_keys(table, chunk[column])
+            present = keys.notna()
+            add("warnings", present & (keys.duplicated() | keys.isin(seen[table])), column, "مكرر في الملف")
+            existing = self._existing_keys(cnx, table, set(keys[present].tolist()))
+            add("warnings", present & keys.isin(existing.keys()), column, "موجود مسبقًا في قاعدة البيانات")
+            seen[table].update(keys[present].tolist())
+
+
+class EmployeeQuery:
+    """بحث الموظفين في SQL: الفلاتر في WHERE وترقيم الصفحات بمفتاح (keyset) بدل OFFSET"""
+    COLUMNS = """
+            e.id,
+            e.general_number,
+            e.name_ar,
+            e.name_en,
+            e.national_id,
+            e.phone,
+            d.name AS department,
+            j.name AS job_title,
+            e.role
+    """
+    JOINS = """
+        LEFT JOIN department_types d ON e.department_id = d.id
+        LEFT JOIN job_titles j ON e.job_title_id = j.id
+    """
+    FTS_JOIN = " JOIN employees_fts ON employees_fts.rowid = e.id"
+
+    # بدون العمود search_text (ترقية 2 لم تُطبق): LIKE على الأعمدة الأصلية دون توحيد
+    RAW_SEARCH_COLUMNS = ["CAST(e.general_number AS TEXT)", "e.name_ar", "e.name_en", "e.national_id", "e.phone"]
+
+    def __init__(self, search_text="", department_id=None, job_title_id=None,
+                 role_fard=False, role_masoul=False, visa_type_ids=None, use_fts=False, use_search_text=True):
+        self.conditions, self.params = [], []
+        self.ranked = False
+        raw_text, search_text = search_text, normalize_arabic(search_text)
+
+        if search_text and use_fts:
+            # الفهرس النصي: بحث بالبادئة مرتب حسب bm25
+            self.ranked = True
+            self.conditions.append("employees_fts MATCH ?")
+            self.params.append(self.fts_expression(search_text))
+        elif search_text and use_search_text:
+            self.conditions.append("e.search_text LIKE ? ESCAPE '\\'")
+            self.params.append(self.like_pattern(search_text))
+        elif search_text:
+            self.conditions.append(
+                "(" + " OR ".join(f"{col} LIKE ? ESCAPE '\\'" for col in self.RAW_SEARCH_COLUMNS) + ")"
+            )
+            self.params += [self.like_pattern(raw_text)] * len(self.RAW_SEARCH_COLUMNS)
+        if department_id:
+            self.conditions.append("e.department_id = ?")
+            self.params.append(department_id)
+        if job_title_id:
+            self.conditions.append("e.job_title_id = ?")
+            self.params.append(job_title_id)
+        if role_fard and not role_masoul:
+            self.conditions.append("e.role = ?")
+            self.params.append("فرد")
+        elif role_masoul and not role_fard:
+            self.conditions.append("e.role = ?")
+            self.params.append("مسؤول")
+        if visa_type_ids:
+            placeholders = ",".join(["?"] * len(visa_type_ids))
+            # استعلام فرعي غير مرتبط: يُحسب مرة واحدة كمجموعة ids بدل فحص كل موظف على حدة
+            self.conditions.append(f"""e.id IN (
+                SELECT p.employee_id FROM visas v
+                JOIN passports p ON v.passport_id = p.id
+                WHERE v.visa_type_id IN ({placeholders})
+            )""")
+            self.params += list(visa_type_ids)
 
-                if not emp.empty:
-                    not_created.append({"الرقم_العام": general_number, "الاسم_بالعربي": row.get("الاسم_بالعربي")})
-                    employee_id = emp.iloc[0]["id"]
-                else:
-                    employee_id = self.db_conn.execute_query("""
-                        INSERT INTO employees (general_number, name_ar, name_en, birth_date,
-                                               national_id, id_issue_date, id_expiry_date,
-                                               department_id, job_title_id, phone, iban_number, role)
-                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                    """, (
-                        general_number, row.get("الاسم_بالعربي"), row.get("الاسم_بالانجليزي"),
-                        row.get("تاريخ_الميلاد"), row.get("رقم_بطاقة_الهوية"),
-                        row.get("تاريخ_بداية_الهوية"), row.get("تاريخ_نهاية_الهوية"),
-                        dept_id, job_id, row.get("رقم_الهاتف"), row.get("رقم_الايبان", ""), None
-                    ), return_id=True)
-
-                passport_id = None
-                if pd.notna(row.get("رقم_الجواز")):
-                    passport_number = str(row.get("رقم_الجواز")).split(".")[0]  # handle floats
-                    r = self.db_conn.execute_query(
-                        "SELECT id FROM passports WHERE passport_number = ?",
-                        (passport_number,), fetch=True
-                    )
-                    if not r.empty:
-                        passport_id = int(r.iloc[0]["id"])
-                    elif passport_type_id:
-                        passport_id = self.db_conn.execute_query("""
-                            INSERT INTO passports (employee_id, passport_number, passport_type_id,
-                                                   issue_date, expiry_date, custodian)
-                            VALUES (?, ?, ?, ?, ?, ?)
-                        """, (
-                            int(employee_id), passport_number, int(passport_type_id),
-                            row.get("تاريخ_بداية_الجواز"), row.get("تاريخ_نهاية_الجواز"), "الشركة"
-                        ), return_id=True)
-                        # print(f"[INFO] Created passport {passport_number} with ID {passport_id}")
-                    # else:
-                        # print(f"[WARN] Skipping passport for employee {general_number}: missing passport type")
-
-                if pd.notna(row.get("رقم_التأشيرة")) and passport_id and visa_type_id:
-                    visa_number = str(row.get("رقم_التأشيرة")).split(".")[0]
-                    r = self.db_conn.execute_query(
-                        "SELECT id FROM visas WHERE visa_number = ?",
-                        (visa_number,), fetch=True
-                    )
-                    if r.empty:
-                        self.db_conn.execute_query("""
-                            INSERT INTO visas (passport_id, visa_number, visa_type_id, issue_date, expiry_date) VALUES (?, ?, ?, ?, ?)
-                        """, (
-                            passport_id, visa_number, visa_type_id,
-                            row.get("تاريخ_بداية_التأشيرة"), row.get("تاريخ_نهاية_التأشيرة")
-                        ))
-                        # print(f"[INFO] Created visa {visa_number} for passport ID {passport_id}")
-                    # else:
-                        # print(f"[INFO] Visa {visa_number} already exists")
+    @staticmethod
+    def like_pattern(text):
+        return "%" + text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
 
-            except Exception as row_err:
-                error_msg = f"صف {idx+2}: {row_err}"
-                errors.append(error_msg)
+    @staticmethod
+    def fts_expression(search_text):
+        """كل كلمة تصبح عبارة FTS5 بالبادئة: "كلمة"*"""
+        return " ".join('"' + token.replace('"', '""') + '"*' for token in search_text.split())
+
+    def _from(self):
+        return " FROM employees e" + (self.FTS_JOIN if self.ranked else "")
+
+    def _where(self, extra=None):
+        conditions = self.conditions + ([extra] if extra else [])
+        return (" WHERE " + " AND ".join(conditions)) if conditions else ""
+
+    def page(self, after_row=None, limit=200):
+        """الصفحة التالية بعد آخر صف معروض؛ مع البحث النصي يكون المفتاح (rank, id)"""
+        params = list(self.params)
+        seek = None
+        if self.ranked:
+            columns, order = self.COLUMNS + ", employees_fts.rank AS sort_rank", " ORDER BY employees_fts.rank, e.id"
+            if after_row is not None:
+                seek = "(employees_fts.rank, e.id) > (?, ?)"
+                params += [after_row[-1], after_row[0]]
+        else:
+            columns, order = self.COLUMNS, " ORDER BY e.id"
+            if after_row is not None:
+                seek = "e.id > ?"
+                params.append(after_row[0])
+        sql = "SELECT " + columns + self._from() + self.JOINS + self._where(seek) + order + " LIMIT ?"
+        return sql, params + [limit]
+
+    def count(self):
+        return "SELECT COUNT(*) AS total" + self._from() + self._where(), list(self.params)
 
-        return {"not_created": not_created, "errors": errors}
+
+class _TreeNode:
+    """عقدة جواز أو تأشيرة تحت صف الموظف"""
+    __slots__ = ('values', 'parent', 'row', 'children', 'color')
+
+    def __init__(self, values, parent, row, color=None):
+        self.values = values
+        self.parent = parent  # رقم صف الموظف أو عقدة الجواز
+        self.row = row
+        self.children = []
+        self.color = color
+
+
+class EmployeesTreeModel(QtCore.QAbstractItemModel):
+    """نموذج شجرة الموظفين: الصفوف مخزنة كـ tuples، والجوازات والتأشيرات تُجلب عند الفتح فقط"""
+    COLUMNS = ['general_number', 'name_ar', 'name_en', 'national_id', 'phone', 'department', 'job_title', 'role']
+    BATCH_SIZE = 200
+    COLORS = {'employee': "#e8f4ff", 'passport': "#e0ffd6", 'visa': "#f9fbe7"}
+
+    def __init__(self, headers, documents_loader, parent=None):
+        super().__init__(parent)
+        self.headers = headers
+        self.documents_loader = documents_loader
+        self.page_loader = None  # (after_row, limit) -> [(id, general_number, name_ar, ...)]
+        self.rows = []
+        self.exhausted = True
+        self.children = {}      # رقم الصف -> [_TreeNode]
+        self.checked = set()
+        self._brushes = {kind: QtGui.QBrush(QtGui.QColor(color)) for kind, color in self.COLORS.items()}
+
+    def set_page_loader(self, page_loader):
+        self.beginResetModel()
+        self.page_loader = page_loader
+        self.rows = []
+        self.children = {}
+        self.exhausted = False
+        self.rows = self._fetch_page()
+        self.endResetModel()
+
+    def _fetch_page(self):
+        page = self.page_loader(self.rows[-1] if self.rows else None, self.BATCH_SIZE)
+        self.exhausted = len(page) < self.BATCH_SIZE
+        return page
+
+    def employee_id(self, index):
+        index = self.top_level_index(index)
+        return self.rows[index.row()][0] if index.isValid() else None
+
+    def top_level_index(self, index):
+        while index.isValid() and index.internalPointer() is not None:
+            index = index.parent()
+        return index.sibling(index.row(), 0) if index.isValid() else index
+
+    def set_checked(self, emp_id, checked):
+        if checked:
+            self.checked.add(emp_id)
+        else:
+            self.checked.discard(emp_id)
+        for row in range(len(self.rows)):
+            if self.rows[row][0] == emp_id:
+                index = self.index(row, 0)
+                self.dataChanged.emit(index, index, [QtCore.Qt.CheckStateRole])
+                break
+
+    # --- بنية الشجرة ---
+    def index(self, row, column, parent=QtCore.QModelIndex()):
+        if not self.hasIndex(row, column, parent):
+            return QtCore.QModelIndex()
+        if not parent.isValid():
+            return self.createIndex(row, column)
+        node = parent.internalPointer()
+        siblings = self.children.get(parent.row(), []) if node is None else node.children
+        return self.createIndex(row, column, siblings[row])
+
+    def parent(self, index):
+        if not index.isValid():
+            return QtCore.QModelIndex()
+        node = index.internalPointer()
+        if node is None:
+            return QtCore.QModelIndex()
+        if isinstance(node.parent, int):
+            return self.createIndex(node.parent, 0)
+        return self.createIndex(node.parent.row, 0, node.parent)
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        if parent.column() > 0:
+            return 0
+        if not parent.isValid():
+            return len(self.rows)
+        node = parent.internalPointer()
+        if node is None:
+            return len(self.children.get(parent.row(), []))
+        return len(node.children)
+
+    def columnCount(self, parent=QtCore.QModelIndex()):
+        return len(self.headers)
+
+    def hasChildren(self, parent=QtCore.QModelIndex()):
+        if not parent.isValid():
+            return bool(self.rows)
+        node = parent.internalPointer()
+        if node is None:
+            # صف الموظف قابل للفتح دائمًا حتى قبل جلب جوازاته
+            return parent.column() == 0
+        return bool(node.children)
+
+    def canFetchMore(self, parent):
+        if not parent.isValid():
+            return not self.exhausted
+        return parent.internalPointer() is None and parent.row() not in self.children
+
+    def fetchMore(self, parent):
+        if not parent.isValid():
+            page = self._fetch_page()
+            if page:
+                self.beginInsertRows(QtCore.QModelIndex(), len(self.rows), len(self.rows) + len(page) - 1)
+                self.rows.extend(page)
+                self.endInsertRows()
+            return
+
+        row = parent.row()
+        nodes = self._build_documents(row, self.documents_loader(self.rows[row][0]))
+        self.beginInsertRows(parent, 0, len(nodes) - 1)
+        self.children[row] = nodes
+        self.endInsertRows()
+
+    def _build_documents(self, row, passports):
+        if not passports:
+            return [_TreeNode(("❌ لا يوجد جواز",), row, 0)]
+
+        nodes = []
+        for pp, visas in passports:
+            pp_node = _TreeNode((
+                pp['passport_number'] or "", str(pp['passport_type']), pp['issue_date'] or "",
+                pp['expiry_date'] or "", pp['issue_authority'] or ""
+            ), row, len(nodes), 'passport')
+            if not visas:
+                pp_node.children.append(_TreeNode(("❌ لا يوجد تأشيرات",), pp_node, 0))
+            for vs in visas:
+                pp_node.children.append(_TreeNode((
+                    vs['visa_number'] or "", str(vs['visa_type']), vs['issue_date'] or "", vs['expiry_date'] or ""
+                ), pp_node, len(pp_node.children), 'visa'))
+            nodes.append(pp_node)
+        return nodes
+
+    # --- البيانات ---
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        node = index.internalPointer()
+        column = index.column()
+
+        if node is None:
+            record = self.rows[index.row()]
+            if role == QtCore.Qt.DisplayRole:
+                if column < len(self.COLUMNS):
+                    value = record[column + 1]
+                    return "" if pd.isna(value) else str(value)
+                return ""
+            if role == QtCore.Qt.BackgroundRole:
+                return self._brushes['employee']
+            if role == QtCore.Qt.CheckStateRole and column == 0:
+                return QtCore.Qt.Checked if record[0] in self.checked else QtCore.Qt.Unchecked
+            if role == QtCore.Qt.UserRole:
+                return record[0]
+            return None
+
+        if role == QtCore.Qt.DisplayRole:
+            return node.values[column] if column < len(node.values) else ""
+        if role == QtCore.Qt.BackgroundRole and node.color:
+            return self._brushes[node.color]
+        return None
+
+    def flags(self, index):
+        if not index.isValid():
+            return QtCore.Qt.NoItemFlags
+        return QtCore.Qt.ItemIsEnabled | QtCore.Qt.ItemIsSelectable
+
+    def headerData(self, section, orientation, role=QtCore.Qt.DisplayRole):
+        if orientation == QtCore.Qt.Horizontal and role == QtCore.Qt.DisplayRole:
+            return self.headers[section]
+        return None
+
+
+class ActionButtonsDelegate(QtWidgets.QStyledItemDelegate):
+    """رسم زري التعديل والحذف في آخر عمود بدل إنشاء QWidget لكل صف"""
+    editClicked = QtCore.pyqtSignal(QtCore.QModelIndex)
+    deleteClicked = QtCore.pyqtSignal(QtCore.QModelIndex)
+    ICON_SIZE = 28
+    SPACING = 3
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.edit_icon = QtGui.QIcon(":/img/icon-compose.png")
+        self.delete_icon = QtGui.QIcon(":/img/icon-delete.png")
+
+    def _button_rects(self, option):
+        size = self.ICON_SIZE
+        top = option.rect.top() + (option.rect.height() - size) // 2
+        if option.direction == QtCore.Qt.RightToLeft:
+            first = QtCore.QRect(option.rect.right() - size, top, size, size)
+            second = first.translated(-(size + self.SPACING), 0)
+        else:
+            first = QtCore.QRect(option.rect.left(), top, size, size)
+            second = first.translated(size + self.SPACING, 0)
+        return first, second
+
+    def paint(self, painter, option, index):
+        super().paint(painter, option, index)
+        if index.internalPointer() is not None:
+            return
+        edit_rect, delete_rect = self._button_rects(option)
+        self.edit_icon.paint(painter, edit_rect)
+        self.delete_icon.paint(painter, delete_rect)
+
+    def sizeHint(self, option, index):
+        hint = super().sizeHint(option, index)
+        if index.internalPointer() is None:
+            hint.setHeight(max(hint.height(), self.ICON_SIZE + 4))
+            hint.setWidth(max(hint.width(), 2 * self.ICON_SIZE + self.SPACING))
+        return hint
+
+    def editorEvent(self, event, model, option, index):
+        if index.internalPointer() is None and event.type() == QtCore.QEvent.MouseButtonRelease:
+            edit_rect, delete_rect = self._button_rects(option)
+            if edit_rect.contains(event.pos()):
+                self.editClicked.emit(index)
+                return True
+            if delete_rect.contains(event.pos()):
+                self.deleteClicked.emit(index)
+                return True
+        return super().editorEvent(event, model, option, index)
 
 
 class MainWindow(Ui_MainWindow, QtWidgets.QMainWindow):
@@ -1389,12 +2651,9 @@ class MainWindow(Ui_MainWindow, QtWidgets.QMainWindow):
         self.setMinimumSize(1786, 924)
         self.showMaximized()
 
-        self.employees_data = pd.DataFrame()
-        self.employees_data_filtered = pd.DataFrame()
-        self.current_page = 1
-        self.rows_per_page = 30
-        self.is_filtered = False  
+        self.employee_query = EmployeeQuery()
         self.selected_ids = []  
+        self.documents_cache = OrderedDict()  # employee_id -> [(passport, [visas])]، الأحدث في النهاية
         self.employee_data_handler = EmployeeDataHandler(self.db_conn)
         self.setup()
 
@@ -1423,6 +2682,11 @@ class MainWindow(Ui_MainWindow, QtWidgets.QMainWindow):
         timer.timeout.connect(self.update_datetime)
         timer.start(30000)
 
+        # checkpoint دوري لملف WAL في أوقات الخمول، بدل انتظار الـ autocheckpoint عند commit يتجاوز 1000 صفحة
+        checkpoint_timer = QtCore.QTimer(self)
+        checkpoint_timer.timeout.connect(self.db_conn.checkpoint)
+        checkpoint_timer.start(300000)
+
         # الموظفين
         self.AddEmployeeButton.clicked.connect(self.open_add_employee_dialog)
 
@@ -1431,22 +2695,45 @@ class MainWindow(Ui_MainWindow, QtWidgets.QMainWindow):
             "رقم الهوية/تاريخ الانتهاء", "الهاتف/جهة الإصدار",
             "القسم", "المسمى_الوظيفي", "الدور", ""
         ]
-        self.EmployeesList.setColumnCount(len(headers))
-        self.EmployeesList.setHeaderLabels(headers)
+        # EmployeesList في MainWindow.ui من نوع QTreeWidget (setModel فيه خاص)، فيُستبدل بـ QTreeView للنموذج
+        employees_view = QtWidgets.QTreeView(self.MainPage1)
+        employees_view.setObjectName("EmployeesList")
+        employees_view.setEditTriggers(QtWidgets.QAbstractItemView.NoEditTriggers)
+        self.verticalLayout.replaceWidget(self.EmployeesList, employees_view)
+        self.EmployeesList.deleteLater()
+        self.EmployeesList = employees_view
+
+        self.employees_model = EmployeesTreeModel(headers, self.load_employee_documents, self)
+        self.EmployeesList.setModel(self.employees_model)
+        self.EmployeesList.setUniformRowHeights(True)
         header = self.EmployeesList.header()
         header.setSectionResizeMode(QtWidgets.QHeaderView.Stretch)
         self.EmployeesList.setColumnWidth(0, 320)
-        self.EmployeesList.itemClicked.connect(self.toggle_selection)
-
-        # التحكم في الصفحات
-        self.PrevPageButton.clicked.connect(self.prev_page)
-        self.NextPageButton.clicked.connect(self.next_page)
+        self.EmployeesList.clicked.connect(self.toggle_selection)
+
+        # أزرار التعديل والحذف مرسومة بواسطة delegate في آخر عمود
+        self.actions_delegate = ActionButtonsDelegate(self.EmployeesList)
+        self.actions_delegate.editClicked.connect(self.open_edit_employee_dialog)
+        self.actions_delegate.deleteClicked.connect(self.delete_employee)
+        self.EmployeesList.setItemDelegateForColumn(len(headers) - 1, self.actions_delegate)
+
+        # القائمة تُحمَّل تدريجيًا عند التمرير، فلا حاجة لأزرار الصفحات
+        for button in (self.PrevPageButton, self.NextPageButton):
+            self.horizontalLayout_10.removeWidget(button)
+            button.deleteLater()
         self.RefrechEmpolyeeButton.clicked.connect(self.refresh_emloyees)
 
         # البحث
         self.SearchButton.clicked.connect(self.search_employees)
         self.SearchEntry.returnPressed.connect(self.search_employees)
         self.ExportExcelButton.clicked.connect(self.export_selected_to_excel)
+        # زر ملفات PDF غير موجود في MainWindow.ui، فيُضاف بعد زر Excel بنفس شكله
+        self.ExportPdfButton = QtWidgets.QPushButton("ملفات PDF", self.frame_7)
+        self.ExportPdfButton.setObjectName("ExportPdfButton")
+        self.ExportPdfButton.setIcon(QtGui.QIcon(":/img/icon-documents.png"))
+        self.ExportPdfButton.setIconSize(self.ExportExcelButton.iconSize())
+        self.horizontalLayout.insertWidget(self.horizontalLayout.indexOf(self.ExportExcelButton) + 1, self.ExportPdfButton)
+        self.ExportPdfButton.clicked.connect(self.export_selected_to_pdf)
         self.ImportButton.clicked.connect(self.import_from_file)
 
         # تحميل البيانات الأولية
@@ -1467,8 +2754,8 @@ class MainWindow(Ui_MainWindow, QtWidgets.QMainWindow):
         dialog.exec_()
         self.refresh_emloyees()
 
-    def open_edit_employee_dialog(self, item):
-        emp_id = item.data(0, QtCore.Qt.UserRole)
+    def open_edit_employee_dialog(self, index):
+        emp_id = self.employees_model.employee_id(index)
         if not emp_id:
             QtWidgets.QMessageBox.warning(self, "خطأ", "لم يتم العثور على رقم الموظف!")
             return
@@ -1477,48 +2764,9 @@ class MainWindow(Ui_MainWindow, QtWidgets.QMainWindow):
         dialog.exec_()
         self.refresh_emloyees()
 
-    @staticmethod
-    def set_item_bg(item, color_hex):
-        color = QtGui.QBrush(QtGui.QColor(color_hex))
-        for col in range(item.columnCount()):
-            item.setBackground(col, color)
-
-    @staticmethod
-    def add_action_buttons(tree_widget, item, update_callback, delete_callback):
-        # إنشاء حاوية أفقية
-        widget = QtWidgets.QWidget()
-        layout = QtWidgets.QHBoxLayout(widget)
-        layout.setContentsMargins(0, 0, 0, 0)
-        layout.setObjectName("horizontalLayout")
-        layout.setSpacing(3)
-
-        btn_update = QtWidgets.QToolButton(widget)
-        icon = QtGui.QIcon()
-        icon.addPixmap(QtGui.QPixmap(":/img/icon-compose.png"), QtGui.QIcon.Normal, QtGui.QIcon.Off)
-        btn_update.setIcon(icon)
-        btn_update.setIconSize(QtCore.QSize(28, 28))
-        btn_update.setObjectName("btn_update")
-        btn_update.clicked.connect(lambda: update_callback(item))
-        
-        btn_delete = QtWidgets.QToolButton(widget)
-        btn_delete.setText("")
-        icon1 = QtGui.QIcon()
-        icon1.addPixmap(QtGui.QPixmap(":/img/icon-delete.png"), QtGui.QIcon.Normal, QtGui.QIcon.Off)
-        btn_delete.setIcon(icon1)
-        btn_delete.setIconSize(QtCore.QSize(28, 28))
-        btn_delete.setObjectName("btn_delete")
-        btn_delete.clicked.connect(lambda: delete_callback(item))
-        
-        layout.addWidget(btn_update)
-        layout.addWidget(btn_delete)
-
-        layout.addStretch()
-
-        # وضع الحاوية في آخر عمود
-        tree_widget.setItemWidget(item, item.columnCount()-1, widget)
-
-    def delete_employee(self, item):
-        emp_id = item.data(0, QtCore.Qt.UserRole)
+    def delete_employee(self, index):
+        index = self.employees_model.top_level_index(index)
+        emp_id = self.employees_model.employee_id(index)
         if not emp_id:
             QtWidgets.QMessageBox.warning(self, "خطأ", "لم يتم العثور على رقم الموظف!")
             return
@@ -1534,7 +2782,7 @@ class MainWindow(Ui_MainWindow, QtWidgets.QMainWindow):
             self.db_conn.execute_query("DELETE FROM visas WHERE passport_id IN (SELECT id FROM passports WHERE employee_id=?)", [emp_id])
             self.db_conn.execute_query("DELETE FROM passports WHERE employee_id=?", [emp_id])
             self.db_conn.execute_query("DELETE FROM employees WHERE id=?", [emp_id])
-            docs_folder = "documents/" + str(item.text(1))
+            docs_folder = "documents/" + str(index.sibling(index.row(), 1).data())
             if os.path.exists(docs_folder):
                 def remove_readonly(func, path, _excinfo):
                     # Make file/folder writable and retry
@@ -1615,265 +2863,129 @@ class MainWindow(Ui_MainWindow, QtWidgets.QMainWindow):
         self.rolecheckBox1.setChecked(False)
         self.rolecheckBox2.setChecked(False)
 
-    def get_page_data(self):
-        """إرجاع بيانات الصفحة الحالية"""
-        start_idx = (self.current_page - 1) * self.rows_per_page
-        end_idx = start_idx + self.rows_per_page
-        return self.employees_data.iloc[start_idx:end_idx]
-
-    def next_page(self):
-        data = self.employees_data_filtered if self.is_filtered else self.employees_data
-        total_pages = max(1, -(-len(data) // self.rows_per_page))
-        if self.current_page < total_pages:
-            self.current_page += 1
-            self.render_employees(filtered=self.is_filtered)
-    
-    def prev_page(self):
-        if self.current_page > 1:
-            self.current_page -= 1
-            self.render_employees(filtered=self.is_filtered)
-
     def update_page_label(self):
-        """تحديث نص عدد الصفحات والموظفين"""
-        data = self.employees_data_filtered if not self.employees_data_filtered.empty else self.employees_data
-        total_employees = len(data)
-        total_pages = max(1, -(-total_employees // self.rows_per_page))
-
-        showing_start = (self.current_page - 1) * self.rows_per_page + 1
-        showing_end = min(self.current_page * self.rows_per_page, total_employees)
-
-        self.PageLabel.setText(
-            f"الموظفون: {showing_start}-{showing_end} من {total_employees} | صفحة {self.current_page} / {total_pages}"
-        )
-    
-
-    def load_all_employees(self):
-        """تحميل كل بيانات الموظفين مرة واحدة فقط"""
-        self.employees_data = self.db_conn.execute_query("""
-            SELECT 
-                e.general_number,
-                e.name_ar,
-                e.name_en,
-                e.national_id,
-                e.phone,
-                d.name AS department,
-                j.name AS job_title,
-                e.role,
-                e.id
-            FROM employees e
-            LEFT JOIN department_types d ON e.department_id = d.id
-            LEFT JOIN job_titles j ON e.job_title_id = j.id
-        """, fetch=True)
-
-        if not isinstance(self.employees_data, pd.DataFrame):
-            QtWidgets.QMessageBox.critical(self, "خطأ", f"فشل جلب بيانات الموظفين:\n{self.employees_data}")
-            self.employees_data = pd.DataFrame()
-
-    @staticmethod
-    def filter_by_text(data, search_text):
-        if not search_text:
-            return data
-        return data[
-            data.apply(
-                lambda row: any(
-                    search_text in str(row[col]).lower()
-                    for col in ["general_number", "name_ar", "name_en", "national_id", "phone"]
-                ),
-                axis=1
-            )
-        ]
-
-    @staticmethod
-    def filter_by_department(data, department_id):
-        if not department_id:
-            return data
-        return data[data["department_id"] == department_id]
-
-    @staticmethod
-    def filter_by_job_title(data, job_title_id):
-        if not job_title_id:
-            return data
-        return data[data["job_title_id"] == job_title_id]
-    
-    @staticmethod
-    def filter_by_role(data, role_fard, role_masoul):
-        if role_fard and not role_masoul:
-            return data[data["role"] == "فرد"]
-        elif role_masoul and not role_fard:
-            return data[data["role"] == "مسؤول"]
-        return data
-
-    def filter_by_visa(self, data, selected_visa_ids):
-        if not selected_visa_ids:
-            return data
-
-        valid_ids = set()
-        for emp_id in data["id"]:
-            visas = self.db_conn.execute_query(
-                """
-                SELECT v.visa_type_id
-                FROM visas v
-                JOIN passports p ON v.passport_id = p.id
-                WHERE p.employee_id = ?
-                """,
-                data=[emp_id],
-                fetch=True
-            )
-            if isinstance(visas, pd.DataFrame) and not visas.empty and any(v_id in selected_visa_ids for v_id in visas["visa_type_id"]):
-                valid_ids.add(emp_id)
+        """تحديث نص عدد الموظفين"""
+        sql, params = self.employee_query.count()
+        try:
+            result = self.db_conn.fetch_one(sql, params)
+        except sqlite3.Error as err:
+            self.PageLabel.setText("الموظفون: -")
+            QtWidgets.QMessageBox.critical(self, "خطأ", f"فشل حساب عدد الموظفين:\n{err}")
+            return
+        total = result['total'] if result else 0
+        self.PageLabel.setText(f"الموظفون: {total}")
 
-        return data[data["id"].isin(valid_ids)]
+    def fetch_employees_page(self, after_row, limit):
+        sql, params = self.employee_query.page(after_row, limit)
+        try:
+            return [tuple(row) for row in self.db_conn.fetch_all(sql, params)]
+        except sqlite3.Error as err:
+            # يُستدعى من النموذج (fetchMore) فلا يرفع؛ الصفحة الفارغة توقف التحميل عند التمرير
+            QtWidgets.QMessageBox.critical(self, "خطأ", f"فشل جلب بيانات الموظفين:\n{err}")
+            return []
 
     def search_employees(self):
         self.SearchButton.setEnabled(False)
-        self.NextPageButton.setEnabled(False)
-        self.PrevPageButton.setEnabled(False)
-
-        if self.employees_data is None or self.employees_data.empty:
-            return
-
-        search_text = self.SearchEntry.text().strip().lower()
-        department_id = self.DepartmentEntry.currentData()
-        job_title_id = self.JopEntry.currentData()
-        role_fard = self.rolecheckBox1.isChecked()
-        role_masoul = self.rolecheckBox2.isChecked()
-        selected_visa_ids = self.VisaTypeEntry.get_selected_ids()
-
-        filtered_data = self.employees_data.copy()
 
-        filtered_data = self.filter_by_text(filtered_data, search_text)
-        filtered_data = self.filter_by_department(filtered_data, department_id)
-        filtered_data = self.filter_by_job_title(filtered_data, job_title_id)
-        filtered_data = self.filter_by_role(filtered_data, role_fard, role_masoul)
-        filtered_data = self.filter_by_visa(filtered_data, selected_visa_ids)
-
-        self.employees_data_filtered = filtered_data.reset_index(drop=True)
-        self.current_page = 1
-        self.is_filtered = True
-        self.render_employees(filtered=True)
+        self.employee_query = EmployeeQuery(
+            search_text=self.SearchEntry.text().strip(),
+            department_id=self.DepartmentEntry.currentData(),
+            job_title_id=self.JopEntry.currentData(),
+            role_fard=self.rolecheckBox1.isChecked(),
+            role_masoul=self.rolecheckBox2.isChecked(),
+            visa_type_ids=self.VisaTypeEntry.get_selected_ids(),
+            use_fts=self.db_conn.has_fts,
+            use_search_text=self.db_conn.has_search_text
+        )
+        self.render_employees()
 
         self.SearchButton.setEnabled(True)
-        self.NextPageButton.setEnabled(True)
-        self.PrevPageButton.setEnabled(True)
-
-    def render_employees(self, filtered=False):
-        """عرض بيانات الموظفين (كاملة أو مفلترة)"""
-        self.EmployeesList.clear()
-        data = self.employees_data_filtered if filtered else self.employees_data
-
-        if data is None or data.empty:
-            return
 
-        start_idx = (self.current_page - 1) * self.rows_per_page
-        end_idx = start_idx + self.rows_per_page
-        page_data = data.iloc[start_idx:end_idx]
-
-        for _, emp in page_data.iterrows():
-            emp_item = QtWidgets.QTreeWidgetItem([
-                str(emp.get('general_number', "")),
-                emp.get('name_ar', ""),
-                emp.get('name_en', ""),
-                emp.get('national_id', ""),
-                emp.get('phone', ""),
-                emp.get('department', ""),
-                emp.get('job_title', ""),
-                emp.get('role', ""),
-                ""
-            ])
-            emp_item.setData(0, QtCore.Qt.UserRole, emp.get('id'))
-            self.set_item_bg(emp_item, "#e8f4ff")
-            emp_item.setFlags(emp_item.flags() | QtCore.Qt.ItemIsUserCheckable)
-            emp_item.setCheckState(0, QtCore.Qt.Unchecked)
-            self.EmployeesList.addTopLevelItem(emp_item)
-
-            self.add_action_buttons(
-                self.EmployeesList,
-                emp_item,
-                update_callback=self.open_edit_employee_dialog,
-                delete_callback=self.delete_employee
-            )
+    def render_employees(self):
+        """عرض نتيجة استعلام الموظفين الحالي؛ الصفحات تُجلب من قاعدة البيانات عند التمرير"""
+        self.employees_model.set_page_loader(self.fetch_employees_page)
+        self.update_page_label()
 
-            # جلب الجوازات والتأشيرات فقط في حالة عرض البيانات الكاملة
-            passports = self.db_conn.execute_query("""
-                SELECT 
-                    p.passport_number,
-                    t.name AS passport_type,
-                    p.issue_date,
-                    p.expiry_date,
-                    p.issue_authority,
-                    p.id
-                FROM passports p
-                LEFT JOIN passport_types t ON p.passport_type_id = t.id
-                WHERE p.employee_id = ?
-            """, data=[emp['id']], fetch=True)
-
-            if not isinstance(passports, pd.DataFrame) or passports.empty:
-                emp_item.addChild(QtWidgets.QTreeWidgetItem(["❌ لا يوجد جواز"]))
-                continue
+    DOCUMENTS_CACHE_SIZE = 300
 
-            for _, pp in passports.iterrows():
-                pp_item = QtWidgets.QTreeWidgetItem([
-                    pp.get('passport_number', ""),
-                    str(pp.get('passport_type', "")),
-                    pp.get('issue_date', ""),
-                    pp.get('expiry_date', ""),
-                    pp.get('issue_authority', ""),
-                    "", "", "", ""
-                ])
-                self.set_item_bg(pp_item, "#e0ffd6")
-                emp_item.addChild(pp_item)
-
-                visas = self.db_conn.execute_query("""
-                    SELECT 
-                        v.visa_number,
-                        t.name AS visa_type,
-                        v.issue_date,
-                        v.expiry_date,
-                        v.id
-                    FROM visas v
-                    LEFT JOIN visa_types t ON v.visa_type_id = t.id
-                    WHERE v.passport_id = ?
-                """, data=[pp['id']], fetch=True)
-
-                if not isinstance(visas, pd.DataFrame) or visas.empty:
-                    pp_item.addChild(QtWidgets.QTreeWidgetItem(["❌ لا يوجد تأشيرات"]))
-                    continue
-
-                for _, vs in visas.iterrows():
-                    vs_item = QtWidgets.QTreeWidgetItem([
-                        vs.get('visa_number', ""),
-                        str(vs.get('visa_type', "")),
-                        vs.get('issue_date', ""),
-                        vs.get('expiry_date', ""),
-                        "", "", "", "", ""
-                    ])
-                    self.set_item_bg(vs_item, "#f9fbe7")
-                    pp_item.addChild(vs_item)
+    def load_employee_documents(self, emp_id):
+        """جوازات وتأشيرات موظف واحد عند فتح صفه، مع ذاكرة LRU بحجم DOCUMENTS_CACHE_SIZE"""
+        if emp_id in self.documents_cache:
+            self.documents_cache.move_to_end(emp_id)
+            return self.documents_cache[emp_id]
+        try:
+            documents = self.load_passports_with_visas([emp_id]).get(emp_id, [])
+        except sqlite3.Error as err:
+            # لا تُحفظ في الذاكرة، فيُعاد المحاولة عند فتح الصف مرة أخرى
+            QtWidgets.QMessageBox.warning(self, "خطأ", f"فشل تحميل الجوازات: {err}")
+            return []
+        self.documents_cache[emp_id] = documents
+        if len(self.documents_cache) > self.DOCUMENTS_CACHE_SIZE:
+            self.documents_cache.popitem(last=False)
+        return documents
+
+    def load_passports_with_visas(self, employee_ids):
+        """{employee_id: [(passport, [visas]), ...]} لمجموعة موظفين بعدد ثابت من الاستعلامات"""
+        documents = {}
+        if not employee_ids:
+            return documents
+
+        placeholders = ",".join(["?"] * len(employee_ids))
+        passports = self.db_conn.fetch_all(f"""
+            SELECT 
+                p.passport_number,
+                t.name AS passport_type,
+                p.issue_date,
+                p.expiry_date,
+                p.issue_authority,
+                p.id,
+                p.employee_id
+            FROM passports p
+            LEFT JOIN passport_types t ON p.passport_type_id = t.id
+            WHERE p.employee_id IN ({placeholders})
+            ORDER BY p.id
+        """, employee_ids)
+        visas = self.db_conn.fetch_all(f"""
+            SELECT 
+                v.visa_number,
+                t.name AS visa_type,
+                v.issue_date,
+                v.expiry_date,
+                v.id,
+                v.passport_id
+            FROM visas v
+            JOIN passports p ON v.passport_id = p.id
+            LEFT JOIN visa_types t ON v.visa_type_id = t.id
+            WHERE p.employee_id IN ({placeholders})
+            ORDER BY v.id
+        """, employee_ids)
 
-        self.update_page_label()
+        visas_by_passport = {}
+        for vs in visas:
+            visas_by_passport.setdefault(vs['passport_id'], []).append(vs)
+        for pp in passports:
+            documents.setdefault(pp['employee_id'], []).append((pp, visas_by_passport.get(pp['id'], [])))
+        return documents
 
     def refresh_emloyees(self):
         """تحديث بيانات الموظفين"""
-        self.current_page = 1
-        self.is_filtered = False
         self.selected_ids = []
+        self.employees_model.checked.clear()
+        self.documents_cache.clear()
         self.reset_search_fields()
-        self.load_all_employees()
-        self.render_employees(filtered=False)
+        self.employee_query = EmployeeQuery()
+        self.render_employees()
 
-    def toggle_selection(self, item, column):
+    def toggle_selection(self, index):
         """Store selected employee IDs across pages (only top-level rows)."""    
-        if item.parent() is None:
-            current_state = item.checkState(0)
-            new_state = QtCore.Qt.Unchecked if current_state == QtCore.Qt.Checked else QtCore.Qt.Checked
-            item.setCheckState(0, new_state)
-        else:
+        if index.parent().isValid() or index.column() == self.employees_model.columnCount() - 1:
             return
 
-
-        emp_id = item.data(0, QtCore.Qt.UserRole) 
+        emp_id = self.employees_model.employee_id(index)
+        checked = emp_id not in self.employees_model.checked
+        self.employees_model.set_checked(emp_id, checked)
     
-        if item.checkState(0) == QtCore.Qt.Checked:
+        if checked:
             if emp_id not in self.selected_ids:
                 self.selected_ids.append(emp_id)
         else:
@@ -1881,44 +2993,169 @@ class MainWindow(Ui_MainWindow, QtWidgets.QMainWindow):
                 self.selected_ids.remove(emp_id)
     
     def export_selected_to_excel(self, filename="selected_employees"):
-        if not self.selected_ids:
-            QtWidgets.QMessageBox.warning(self, "تنبيه", "لم يتم تحديد أي موظف للتصدير.")
-            return
-    
+        # نسخة من التحديد: النافذة تبقى قابلة للاستعمال أثناء التصدير
+        selected_ids = list(self.selected_ids)
+        if not selected_ids:
+            reply = QtWidgets.QMessageBox.question(
+                self, "تنبيه", "لم يتم تحديد أي موظف. هل تريد تصدير جميع الموظفين؟",
+                QtWidgets.QMessageBox.Yes | QtWidgets.QMessageBox.No
+            )
+            if reply != QtWidgets.QMessageBox.Yes:
+                return
+            selected_ids, filename = None, "all_employees"
+
         file_path, _ = QtWidgets.QFileDialog.getSaveFileName(
-            self, "حفظ ملف Excel", "selected_employees", "Excel Files (*.xlsx)"
+            self, "حفظ ملف Excel", filename, "Excel Files (*.xlsx);;CSV (*.csv)"
         )
         if not file_path:
             return
-        if not file_path.endswith(".xlsx"):
+        if not file_path.lower().endswith((".xlsx", ".csv")):
             file_path += ".xlsx"
-    
-        df = self.employee_data_handler.export_selected_data(self.selected_ids)
-        if df is None or df.empty:
+
+        self.run_background_task(
+            "جاري تصدير البيانات...",
+            lambda report, is_cancelled: self.employee_data_handler.export_to_file(
+                file_path, selected_ids, report, is_cancelled
+            ),
+            lambda info: f"تمت كتابة {info['rows']} من {info['total']} صف",
+            lambda count: self.export_finished(file_path, count),
+            "تم إلغاء التصدير، ولم يتغير الملف المحدد.",
+            modal=False
+        )
+
+    def export_finished(self, file_path, count, unit="صف"):
+        if not count:
             QtWidgets.QMessageBox.warning(self, "تنبيه", "لم يتم العثور على بيانات للتصدير")
             return
-    
-        try:
-            df.to_excel(file_path, index=False)
-            QtWidgets.QMessageBox.information(self, "نجاح", f"تم تصدير البيانات إلى:\n{file_path}")
-        except Exception as e:
-            QtWidgets.QMessageBox.critical(self, "خطأ", f"حدث خطأ أثناء التصدير:\n{str(e)}")
-    
+        # تنبيه في شريط المهام إن كانت النافذة في الخلفية
+        QtWidgets.QApplication.alert(self)
+        reply = QtWidgets.QMessageBox.question(
+            self, "نجاح", f"تم تصدير {count} {unit} إلى:\n{file_path}\n\n"
+            + ("هل تريد فتح الملف؟" if os.path.isfile(file_path) else "هل تريد فتح المجلد؟"),
+            QtWidgets.QMessageBox.Yes | QtWidgets.QMessageBox.No
+        )
+        if reply == QtWidgets.QMessageBox.Yes:
+            QtGui.QDesktopServices.openUrl(QtCore.QUrl.fromLocalFile(file_path))
+
+    def export_selected_to_pdf(self):
+        selected_ids = list(self.selected_ids)
+        if not selected_ids:
+            QtWidgets.QMessageBox.warning(self, "تنبيه", "يرجى تحديد الموظفين أولاً")
+            return
+
+        out_dir = QtWidgets.QFileDialog.getExistingDirectory(self, "اختر مجلد حفظ ملفات PDF")
+        if not out_dir:
+            return
+
+        self.run_background_task(
+            "جاري إنشاء ملفات PDF...",
+            lambda report, is_cancelled: self.employee_data_handler.export_dossiers(
+                out_dir, selected_ids, report, is_cancelled
+            ),
+            lambda info: f"تم إنشاء {info['rows']} من {info['total']} ملف",
+            lambda result: self.dossiers_finished(out_dir, result),
+            "تم إلغاء إنشاء الملفات وحذف ما أُنشئ منها.",
+            modal=False
+        )
+
+    def dossiers_finished(self, out_dir, result):
+        if result["errors"]:
+            errors = result["errors"][:50]
+            if len(result["errors"]) > len(errors):
+                errors.append(f"... و{len(result['errors']) - len(errors)} أخطاء أخرى")
+            msg = "❌ ملفات لم يتم إنشاؤها بسبب أخطاء:\n" + "\n".join(errors)
+            QtWidgets.QMessageBox.warning(self, "تنبيه", msg)
+        if result["paths"] or not result["errors"]:
+            self.export_finished(out_dir, len(result["paths"]), "ملف PDF")
+
     def import_from_file(self):
         file_path, _ = QFileDialog.getOpenFileName(
-            self, "استيراد بيانات الموظفين", "", "ملفات Excel (*.xlsx *.xls)"
+            self, "استيراد بيانات الموظفين", "", EmployeeDataHandler.file_filter()
         )
         if not file_path:
             return
-    
-        result = self.employee_data_handler.import_data(file_path)
-    
+
+        # فحص الملف أولاً دون الكتابة في قاعدة البيانات
+        self.run_background_task(
+            "جاري فحص الملف...",
+            lambda report, is_cancelled: self.employee_data_handler.validate_import(file_path, report, is_cancelled),
+            lambda info: f"تم فحص {info['rows']} صف ({info['rate']:.0f} صف/ثانية)، الأخطاء: {info['errors']}",
+            lambda report: self.confirm_import(file_path, report),
+            "تم إلغاء فحص الملف."
+        )
+
+    def confirm_import(self, file_path, report):
+        if report["errors"] or report["warnings"]:
+            issues = report["errors"] + report["warnings"]
+            lines = [
+                (f"صف {issue['row']} - " if issue["row"] else "") + f"{issue['column']}: {issue['message']}"
+                + (f" ({issue['value']})" if issue["value"] is not None else "")
+                for issue in issues[:30]
+            ]
+            if len(issues) > len(lines):
+                lines.append(f"... و{len(issues) - len(lines)} ملاحظات أخرى")
+            msg = (
+                f"عدد الصفوف: {report['rows']}\n"
+                f"❌ صفوف فيها أخطاء: {len({e['row'] for e in report['errors']})}\n"
+                f"⚠️ صفوف مكررة أو موجودة مسبقًا: {len({w['row'] for w in report['warnings']})}\n\n"
+                + "\n".join(lines) + "\n\nهل تريد متابعة الاستيراد؟"
+            )
+            reply = QtWidgets.QMessageBox.question(
+                self, "نتيجة فحص الملف", msg, QtWidgets.QMessageBox.Yes | QtWidgets.QMessageBox.No
+            )
+            if reply != QtWidgets.QMessageBox.Yes:
+                return
+
+        self.run_background_task(
+            "جاري استيراد بيانات الموظفين...",
+            lambda report, is_cancelled: self.employee_data_handler.import_data(file_path, report, is_cancelled),
+            lambda info: f"تمت معالجة {info['rows']} صف ({info['rate']:.0f} صف/ثانية)، الأخطاء: {info['errors']}",
+            self.import_finished,
+            "تم إلغاء الاستيراد ولم يُحفظ أي صف."
+        )
+
+    def import_finished(self, result):
+        # تحديث القائمة مرة واحدة بعد انتهاء الاستيراد
+        self.refresh_emloyees()
         if result["errors"]:
-            msg = "❌ صفوف تم تخطيها بسبب أخطاء:\n" + "\n".join(result["errors"])
+            errors = result["errors"][:50]
+            if len(result["errors"]) > len(errors):
+                errors.append(f"... و{len(result['errors']) - len(errors)} أخطاء أخرى")
+            msg = "❌ صفوف تم تخطيها بسبب أخطاء:\n" + "\n".join(errors)
             QtWidgets.QMessageBox.warning(self, "تنبيه", msg)
         else:
             QtWidgets.QMessageBox.information(self, "نجاح", "تم استيراد البيانات بنجاح ✅")
-            self.refresh_emloyees()
+
+    def run_background_task(self, title, func, describe, on_success, cancelled_message, modal=True):
+        """تشغيل func في BackgroundTask مع نافذة تقدم وزر إلغاء؛ modal=False يترك النافذة الرئيسية متاحة"""
+        dialog = QtWidgets.QProgressDialog(title, "إلغاء", 0, 0, self)
+        dialog.setWindowTitle(self.app_title)
+        dialog.setWindowModality(QtCore.Qt.WindowModal if modal else QtCore.Qt.NonModal)
+        dialog.setMinimumDuration(0)
+        dialog.setAutoClose(False)
+        dialog.setAutoReset(False)
+
+        def show_progress(info):
+            dialog.setLabelText(describe(info))
+            if info.get("total"):
+                dialog.setMaximum(info["total"])
+                dialog.setValue(info["rows"])
+
+        task = BackgroundTask(func, self.db_conn, self)
+        # إخفاء نافذة التقدم قبل أي رسالة نتيجة
+        for signal in (task.succeeded, task.failed, task.cancelled):
+            signal.connect(dialog.hide)
+        task.progress.connect(show_progress)
+        task.succeeded.connect(on_success)
+        task.failed.connect(lambda err: QtWidgets.QMessageBox.critical(self, "خطأ", f"حدث خطأ:\n{err}"))
+        task.cancelled.connect(lambda: QtWidgets.QMessageBox.information(self, "إلغاء", cancelled_message))
+        dialog.canceled.connect(task.cancel)
+        dialog.canceled.connect(lambda: dialog.setLabelText("جاري الإلغاء..."))
+        task.finished.connect(task.deleteLater)
+        task.finished.connect(dialog.deleteLater)
+        dialog.show()
+        task.start()
+        return task
 
     def toggle_select_all(self, state):
         if state == QtCore.Qt.Checked:
@@ -1965,21 +3202,22 @@ class MainWindow(Ui_MainWindow, QtWidgets.QMainWindow):
         if where_clause:
             query += " WHERE " + where_clause
     
-        df = self.db_conn.execute_query(query, params or [], fetch=True)
-    
-        if not hasattr(df, "iterrows"):
-            QtWidgets.QMessageBox.warning(self, "خطأ", f"فشل تحميل الجوازات: {df}")
+        # كل التصفية في WHERE (search_custody_passports)، والصفوف تُعرض مباشرة دون DataFrame
+        try:
+            rows = self.db_conn.fetch_all(query, params or [])
+        except sqlite3.Error as err:
+            QtWidgets.QMessageBox.warning(self, "خطأ", f"فشل تحميل الجوازات: {err}")
             return
     
         self.table_passport_custody.clearSelection()
-        self.table_passport_custody.setRowCount(len(df))
-        for i, row in df.iterrows():
+        self.table_passport_custody.setRowCount(len(rows))
+        for i, row in enumerate(rows):
             color = QtGui.QColor("#e3f2e3") if row['custodian'] == "الموظف" else QtGui.QColor("#f7f5e3")
-            for j, col in enumerate(df.columns):
+            for j, col in enumerate(row.keys()):
                 if col == 'custodian':
                     text = "مستلم" if row['custodian'] == "الموظف" else "غير مستلم"
                 elif col == 'received_at':
-                    text = row['received_at'][:10] if pd.notna(row['received_at']) else ""
+                    text = (row['received_at'] or "")[:10]
                 else:
                     text = str(row[col]) if row[col] else ""
                 item = QtWidgets.QTableWidgetItem(text)
@@ -1995,15 +3233,32 @@ class MainWindow(Ui_MainWindow, QtWidgets.QMainWindow):
         is_received = self.receivedCheckBox.isChecked()
         is_not_received = self.notReceivedCheckBox.isChecked()
     
-        if emp_name:
-            conditions.append("e.name_ar LIKE ?")
-            params.append(f"%{emp_name}%")
-        if delivered_by:
-            conditions.append("p.delivered_by LIKE ?")
-            params.append(f"%{delivered_by}%")
-        if received_by:
-            conditions.append("p.received_by LIKE ?")
-            params.append(f"%{received_by}%")
+        # المقارنة على القيم الموحَّدة المخزنة عند الكتابة (الهمزات، التاء المربوطة، الألف المقصورة، التشكيل):
+        # فهارس FTS5 إن وجدت، وإلا LIKE على الأعمدة الموحَّدة
+        if emp_name and self.db_conn.has_fts:
+            conditions.append("p.employee_id IN (SELECT rowid FROM employees_fts WHERE employees_fts MATCH ?)")
+            params.append(f"name_ar : ({EmployeeQuery.fts_expression(normalize_arabic(emp_name))})")
+        elif emp_name and self.db_conn.has_search_text:
+            conditions.append("e.search_text LIKE ? ESCAPE '\\'")
+            params.append(EmployeeQuery.like_pattern(normalize_arabic(emp_name)))
+        elif emp_name:
+            conditions.append("e.name_ar LIKE ? ESCAPE '\\'")
+            params.append(EmployeeQuery.like_pattern(emp_name))
+        fts_terms = []
+        for column, text in (("delivered_by", delivered_by), ("received_by", received_by)):
+            if not text:
+                continue
+            if self.db_conn.has_fts:
+                fts_terms.append(f"{column} : ({EmployeeQuery.fts_expression(normalize_arabic(text))})")
+            elif self.db_conn.has_custody_search:
+                conditions.append(f"p.{SchemaMigrator.PASSPORT_SEARCH_COLUMNS[column]} LIKE ? ESCAPE '\\'")
+                params.append(EmployeeQuery.like_pattern(normalize_arabic(text)))
+            else:
+                conditions.append(f"p.{column} LIKE ? ESCAPE '\\'")
+                params.append(EmployeeQuery.like_pattern(text))
+        if fts_terms:
+            conditions.append("p.id IN (SELECT rowid FROM passports_fts WHERE passports_fts MATCH ?)")
+            params.append(" AND ".join(fts_terms))
         if is_received and not is_not_received:
             conditions.append("p.custodian = ?")
             params.append("الموظف")
@@ -2139,45 +3394,44 @@ class MainWindow(Ui_MainWindow, QtWidgets.QMainWindow):
         self.filter_visas(0)
 
     def filter_passports(self, days):
-        query = """
+        condition, params = self._expiry_condition("p.expiry_date", days)
+        query = f"""
         SELECT p.id, e.name_ar AS employee_name, p.passport_number, p.expiry_date
         FROM passports p
         LEFT JOIN employees e ON e.id = p.employee_id
+        WHERE {condition}
+        ORDER BY p.expiry_date
         """
-        df = self.db_conn.execute_query(query, fetch=True)
-        self.show_passports(self._filter_by_days(df, days, "expiry_date"))
+        try:
+            self.show_passports(self.db_conn.fetch_all(query, params))
+        except sqlite3.Error as err:
+            QtWidgets.QMessageBox.warning(self, "خطأ", f"فشل تحميل الجوازات: {err}")
 
     def filter_visas(self, days):
-        query = """
+        condition, params = self._expiry_condition("v.expiry_date", days)
+        query = f"""
         SELECT v.id, e.name_ar AS employee_name, p.passport_number, v.visa_number, v.expiry_date
         FROM visas v
         LEFT JOIN passports p ON p.id = v.passport_id
         LEFT JOIN employees e ON e.id = p.employee_id
+        WHERE {condition}
+        ORDER BY v.expiry_date
         """
-        df = self.db_conn.execute_query(query, fetch=True)
-        self.show_visas(self._filter_by_days(df, days, "expiry_date"))
+        try:
+            self.show_visas(self.db_conn.fetch_all(query, params))
+        except sqlite3.Error as err:
+            QtWidgets.QMessageBox.warning(self, "خطأ", f"فشل تحميل التأشيرات: {err}")
 
     @staticmethod
-    def _filter_by_days(df, days, date_col):
+    def _expiry_condition(date_col, days):
+        """شرط نطاق نصي على عمود التاريخ يستخدم الفهرس؛ القيم بغير صيغة yyyy-MM-dd تُستبعد"""
         today = datetime.today().date()
-        filtered = []
-        
-        if not isinstance(df, pd.DataFrame):
-            return
-
-        for _, row in df.iterrows():
-            try:
-                exp_date = datetime.strptime(row[date_col], "%Y-%m-%d").date()
-            except Exception:
-                continue
-            diff_days = (exp_date - today).days
-            if days == 0:
-                if diff_days <= 0:  # منتهية فعليًا
-                    filtered.append(row)
-            else:
-                if 0 < diff_days <= days:
-                    filtered.append(row)
-        return filtered
+        tomorrow = (today + timedelta(days=1)).isoformat()
+        iso = f"{date_col} GLOB '[0-9][0-9][0-9][0-9]-[0-1][0-9]-[0-3][0-9]'"
+        if days == 0:
+            # منتهية فعليًا؛ '0' يستبعد القيم الفارغة
+            return f"{date_col} >= '0' AND {date_col} < ? AND {iso}", [tomorrow]
+        return f"{date_col} >= ? AND {date_col} < ? AND {iso}", [tomorrow, (today + timedelta(days=days + 1)).isoformat()]
 
     def show_passports(self, rows):
         self.table_passports.setRowCount(0)
@@ -2209,11 +3463,15 @@ class MainWindow(Ui_MainWindow, QtWidgets.QMainWindow):
             return
     
         query = "SELECT username, password FROM user WHERE id = 1"
-        result = self.db_conn.execute_query(query, fetch=True)
+        try:
+            result = self.db_conn.fetch_one(query)
+        except sqlite3.Error as err:
+            QtWidgets.QMessageBox.critical(self, "خطأ", f"فشل الاتصال بقاعدة البيانات:\n{err}")
+            return
     
-        if isinstance(result, pd.DataFrame) and not result.empty:
-            db_username = str(result.at[0, 'username']).strip()
-            db_password = str(result.at[0, 'password'])
+        if result is not None:
+            db_username = str(result['username']).strip()
+            db_password = str(result['password'])
     
             if username == db_username and password == db_password:
                 self.Main.setCurrentIndex(0)
@@ -2221,8 +3479,23 @@ class MainWindow(Ui_MainWindow, QtWidgets.QMainWindow):
             else:
                 QtWidgets.QMessageBox.warning(self, "خطأ", "اسم المستخدم أو كلمة المرور غير صحيحة!")
         else:
-            QtWidgets.QMessageBox.warning(self, "خطأ", "المستخدم (ID=1) غير موجود!")
-    
+            # أول تشغيل: لا يوجد حساب، فتصبح البيانات المدخلة هي حساب الدخول
+            reply = QtWidgets.QMessageBox.question(
+                self, "أول تشغيل",
+                f"لا يوجد حساب دخول بعد.\nهل تريد إنشاء حساب باسم المستخدم \"{username}\" وكلمة المرور المدخلة؟",
+                QtWidgets.QMessageBox.Yes | QtWidgets.QMessageBox.No
+            )
+            if reply != QtWidgets.QMessageBox.Yes:
+                return
+            result = self.db_conn.execute_query(
+                "INSERT INTO user (id, username, password) VALUES (1, ?, ?)", [username, password]
+            )
+            if isinstance(result, str) and result.startswith("حدث خطأ"):
+                QtWidgets.QMessageBox.critical(self, "خطأ", result)
+                return
+            self.Main.setCurrentIndex(0)
+            self.Root.setCurrentIndex(1)
+
     def change_credentials(self):
         username = self.lineEditUsername.text().strip()
         password = self.lineEditPassword.text().strip()
@@ -2232,10 +3505,10 @@ class MainWindow(Ui_MainWindow, QtWidgets.QMainWindow):
             return
     
         try:
-            check_query = "SELECT * FROM user WHERE id=1"
-            result = self.db_conn.execute_query(check_query, fetch=True)
+            check_query = "SELECT id FROM user WHERE id=1"
+            result = self.db_conn.fetch_one(check_query)
     
-            if isinstance(result, pd.DataFrame) and not result.empty:
+            if result is not None:
                 update_query = "UPDATE user SET username=?, password=? WHERE id=1"
                 self.db_conn.execute_query(update_query, [username, password])
             else:
@@ -2276,8 +3549,17 @@ class MainWindow(Ui_MainWindow, QtWidgets.QMainWindow):
         if reply == QtWidgets.QMessageBox.Yes:
             self.close()
 
+    def closeEvent(self, event):
+        # المهام الخلفية تستعمل اتصالات من نفس الـ pool: إلغاؤها وانتظارها قبل الإغلاق
+        for task in self.findChildren(BackgroundTask):
+            task.cancel()
+            task.wait()
+        self.db_conn.checkpoint('TRUNCATE')
+        self.db_conn.close()
+        super().closeEvent(event)
 
-if __name__ == '__main__':
+
+def run():
     try:
         app = QtWidgets.QApplication(sys.argv)
         window = MainWindow()
@@ -2290,7 +3572,13 @@ if __name__ == '__main__':
         )
         raise e
 
+
+if __name__ == '__main__':
+    # للتطوير فقط: عمليات ملفات PDF تعيد استيراد هذا الملف بكل واجهته، ونقطة الدخول المجمعة هي hrm.py
+    multiprocessing.freeze_support()
+    run()
+
 # pyuic5 ui/MainWindow.ui -o MainWindow.py
 # pyuic5 ui/EditEmployeePage.ui -o EditEmployeePage.py
 # pyrcc5 ui/img/img.qrc -o img_rc.py
-# pyinstaller --windowed --icon=ui\img\logo.ico --add-data="ui\img\logo.png;." --name "HRM" main.py
+# pyinstaller --windowed --icon=ui\img\logo.ico --add-data="ui\img\logo.png;." --name "HRM" hrm.py
@@ -0,0 +1,323 @@
+"""ملفات PDF للموظفين (reportlab)
+
+وحدة مستقلة عن الواجهة حتى تستوردها عمليات ProcessPoolExecutor دون تحميل PyQt5 أو قاعدة البيانات.
+كل ملف يُبنى من قاموس dossier كما يرجعه EmployeeDataHandler.fetch_dossiers.
+"""
+import os
+import logging
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from functools import lru_cache
+
+import arabic_reshaper
+from bidi.algorithm import get_display
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+
+# (عادي، عريض): خطوط ويندوز أولاً ثم DejaVu على لينكس
+FONT_CANDIDATES = [
+    (os.path.join(os.environ.get("WINDIR", r"C:\Windows"), "Fonts", regular),
+     os.path.join(os.environ.get("WINDIR", r"C:\Windows"), "Fonts", bold))
+    for regular, bold in (("arial.ttf", "arialbd.ttf"), ("tahoma.ttf", "tahomabd.ttf"))
+] + [
+    ("/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf", "/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf"),
+]
+
+PAGE_WIDTH, PAGE_HEIGHT = A4
+MARGIN = 40
+RIGHT = PAGE_WIDTH - MARGIN
+LINE_HEIGHT = 18
+PHOTO_SIZE = (90, 110)
+
+# دفعات صغيرة للمستقبل الواحد: أقل كلفة تسلسل بين العمليات من ملف لكل مهمة
+BATCH_SIZE = 20
+# تحت هذا العدد يكون تشغيل العمليات أبطأ من الرسم في نفس العملية
+PARALLEL_THRESHOLD = 40
+
+EMPLOYEE_FIELDS = [
+    ("الرقم العام", "general_number"),
+    ("الاسم بالعربي", "name_ar"),
+    ("الاسم بالانجليزي", "name_en"),
+    ("القسم", "department"),
+    ("المسمى الوظيفي", "job_title"),
+    ("تاريخ الميلاد", "birth_date"),
+    ("رقم بطاقة الهوية", "national_id"),
+    ("تاريخ بداية الهوية", "id_issue_date"),
+    ("تاريخ نهاية الهوية", "id_expiry_date"),
+    ("رقم الهاتف", "phone"),
+    ("رقم الايبان", "iban_number"),
+]
+PASSPORT_FIELDS = [
+    ("تاريخ الإصدار", "issue_date"),
+    ("تاريخ الانتهاء", "expiry_date"),
+    ("جهة الإصدار", "issue_authority"),
+    ("العهدة", "custodian"),
+]
+# أعمدة جدول التأشيرات من اليمين: (العنوان، المفتاح، العرض)
+VISA_COLUMNS = [
+    ("رقم التأشيرة", "visa_number", 140),
+    ("نوع التأشيرة", "visa_type", 140),
+    ("تاريخ الإصدار", "issue_date", 110),
+    ("تاريخ الانتهاء", "expiry_date", 110),
+]
+
+
+@lru_cache(maxsize=None)
+def register_fonts():
+    """يسجل الخط مرة واحدة لكل عملية ويرجع (عادي، عريض)"""
+    for regular, bold in FONT_CANDIDATES:
+        if os.path.exists(regular) and os.path.exists(bold):
+            pdfmetrics.registerFont(TTFont("Dossier", regular))
+            pdfmetrics.registerFont(TTFont("Dossier-Bold", bold))
+            return "Dossier", "Dossier-Bold"
+    logging.warning("لم يتم العثور على خط يدعم العربية، سيتم استعمال Helvetica")
+    return "Helvetica", "Helvetica-Bold"
+
+
+class TextShaper:
+    """تشكيل النص العربي (arabic_reshaper ثم bidi) مع ذاكرة LRU لكل عملية، فالقيم المتكررة تُشكَّل مرة واحدة"""
+
+    def __init__(self, maxsize=8192):
+        self._cached = lru_cache(maxsize=maxsize)(self._reshape)
+
+    @staticmethod
+    def _reshape(text):
+        return get_display(arabic_reshaper.reshape(text))
+
+    def shape(self, value):
+        if value is None:
+            return ""
+        text = value if isinstance(value, str) else str(value)
+        # ASCII (تواريخ، أرقام، أسماء لاتينية) لا يحتاج تشكيلًا، ولا يزاحم النصوص المتكررة في الذاكرة
+        if text.isascii():
+            return text
+        return self._cached(text)
+
+    def shape_many(self, values):
+        return [self.shape(value) for value in values]
+
+    def stats(self):
+        info = self._cached.cache_info()
+        lookups = info.hits + info.misses
+        return {
+            "hits": info.hits,
+            "misses": info.misses,
+            "size": info.currsize,
+            "maxsize": info.maxsize,
+            "hit_rate": info.hits / lookups if lookups else 0.0,
+        }
+
+    def clear(self):
+        self._cached.cache_clear()
+
+
+shaper = TextShaper()
+
+
+class _DossierCanvas:
+    """Canvas مع موضع سطر حالي وانتقال تلقائي إلى صفحة جديدة"""
+
+    def __init__(self, file_path, dossier):
+        self.fonts = register_fonts()
+        self.dossier = dossier
+        self.page = 1
+        self.c = canvas.Canvas(file_path, pagesize=A4)
+        self.c.setTitle(str(dossier.get("name_ar") or dossier.get("general_number")))
+        self.y = PAGE_HEIGHT - MARGIN
+
+    def ensure(self, height):
+        if self.y - height < MARGIN + LINE_HEIGHT:
+            self.footer()
+            self.c.showPage()
+            self.page += 1
+            self.y = PAGE_HEIGHT - MARGIN
+
+    def footer(self):
+        self.c.setFont(self.fonts[0], 8)
+        self.c.drawString(MARGIN, MARGIN / 2, f"{self.dossier.get('general_number')}  -  {self.page}")
+        self.c.drawRightString(RIGHT, MARGIN / 2, datetime.now().strftime("%Y-%m-%d"))
+
+    def text(self, x, text, bold=False, size=10):
+        self.c.setFont(self.fonts[bold], size)
+        self.c.drawRightString(x, self.y, text)
+
+    def heading(self, text):
+        self.ensure(LINE_HEIGHT * 3)
+        self.y -= LINE_HEIGHT / 2
+        self.text(RIGHT, shaper.shape(text), bold=True, size=13)
+        self.c.line(MARGIN, self.y - 4, RIGHT, self.y - 4)
+        self.y -= LINE_HEIGHT * 1.5
+
+    def fields(self, fields, data, right=RIGHT):
+        labels = shaper.shape_many(label for label, _ in fields)
+        values = shaper.shape_many(data.get(key) for _, key in fields)
+        for label, value in zip(labels, values):
+            self.ensure(LINE_HEIGHT)
+            self.text(right, label, bold=True)
+            self.text(right - 120, value)
+            self.y -= LINE_HEIGHT
+
+    def save(self):
+        self.footer()
+        self.c.save()
+
+
+def _draw_photo(doc, photo_path):
+    if not photo_path or not os.path.exists(photo_path):
+        return
+    width, height = PHOTO_SIZE
+    try:
+        doc.c.drawImage(
+            ImageReader(photo_path), MARGIN, PAGE_HEIGHT - MARGIN - height, width, height,
+            preserveAspectRatio=True, anchor="c"
+        )
+    except (OSError, ValueError) as e:
+        logging.warning("تعذر رسم الصورة %s: %s", photo_path, e)
+
+
+def render_dossier(dossier, file_path):
+    """يرسم ملف موظف واحد: البيانات والصورة ثم الجوازات وتأشيرات كل جواز"""
+    doc = _DossierCanvas(file_path, dossier)
+    _draw_photo(doc, dossier.get("photo_path"))
+
+    doc.text(RIGHT, shaper.shape("ملف الموظف"), bold=True, size=18)
+    doc.y -= LINE_HEIGHT * 1.5
+    doc.text(RIGHT, shaper.shape(dossier.get("name_ar")), bold=True, size=14)
+    doc.y -= LINE_HEIGHT * 1.5
+
+    doc.heading("البيانات الشخصية")
+    doc.fields(EMPLOYEE_FIELDS, dossier)
+
+    doc.heading("الجوازات")
+    if not dossier["passports"]:
+        doc.text(RIGHT, shaper.shape("لا توجد جوازات"))
+        doc.y -= LINE_HEIGHT
+    for passport in dossier["passports"]:
+        doc.ensure(LINE_HEIGHT * (len(PASSPORT_FIELDS) + 2))
+        doc.text(
+            RIGHT, shaper.shape(f"جواز رقم {passport['passport_number'] or ''} - {passport['passport_type'] or ''}"),
+            bold=True, size=11
+        )
+        doc.y -= LINE_HEIGHT
+        doc.fields(PASSPORT_FIELDS, passport, right=RIGHT - 15)
+        _draw_visas(doc, passport["visas"])
+        doc.y -= LINE_HEIGHT / 2
+
+    doc.save()
+    return file_path
+
+
+def _draw_visas(doc, visas):
+    if not visas:
+        return
+    doc.ensure(LINE_HEIGHT * 2)
+    x = RIGHT - 15
+    for (_, _, width), title in zip(VISA_COLUMNS, shaper.shape_many(title for title, _, _ in VISA_COLUMNS)):
+        doc.text(x, title, bold=True, size=9)
+        x -= width
+    doc.c.line(x, doc.y - 4, RIGHT - 15, doc.y - 4)
+    doc.y -= LINE_HEIGHT
+    for visa in visas:
+        doc.ensure(LINE_HEIGHT)
+        x = RIGHT - 15
+        for (_, _, width), value in zip(VISA_COLUMNS, shaper.shape_many(visa.get(key) for _, key, _ in VISA_COLUMNS)):
+            doc.text(x, value, size=9)
+            x -= width
+        doc.y -= LINE_HEIGHT
+
+
+def dossier_path(out_dir, dossier):
+    # الرقم العام غير فريد، فيُضاف إليه معرف الموظف
+    return os.path.join(out_dir, f"{dossier['general_number']}_{dossier['id']}.pdf")
+
+
+def _render_batch(dossiers, out_dir):
+    paths, errors = [], []
+    for dossier in dossiers:
+        file_path = dossier_path(out_dir, dossier)
+        try:
+            paths.append(render_dossier(dossier, file_path))
+        except Exception as e:
+            # ملف لم يكتمل لا يبقى في المجلد
+            if os.path.exists(file_path):
+                os.remove(file_path)
+            errors.append(f"الرقم العام {dossier['general_number']}: {e}")
+    return paths, errors, os.getpid(), shaper.stats()
+
+
+def render_dossiers(dossiers, out_dir, workers=None, progress=None, is_cancelled=None):
+    """يرسم الملفات في out_dir ويرجع (المسارات المكتملة، أخطاء الملفات الفاشلة)
+
+    الدفعات الكبيرة على ProcessPoolExecutor؛ عند الإلغاء يُرجع ما اكتمل، وأي خطأ آخر يحذف ما كُتب ثم يُرفع.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    total = len(dossiers)
+    batches = [dossiers[i:i + BATCH_SIZE] for i in range(0, total, BATCH_SIZE)]
+    done, errors = [], []
+    shaping_stats = {}  # pid -> shaper.stats() لآخر دفعة في تلك العملية
+    # دفعة عملية متوقفة لا ترجع مساراتها؛ عند الخطأ يُحذف كل ملف لم يكن موجودًا قبل البدء
+    existing = {path for path in (dossier_path(out_dir, dossier) for dossier in dossiers) if os.path.exists(path)}
+
+    def collect(result):
+        paths, batch_errors, pid, stats = result
+        done.extend(paths)
+        errors.extend(batch_errors)
+        shaping_stats[pid] = stats
+
+    def batch_done(result):
+        collect(result)
+        if progress:
+            progress({"rows": len(done) + len(errors), "total": total})
+
+    try:
+        if workers == 1 or total < PARALLEL_THRESHOLD:
+            for batch in batches:
+                if is_cancelled and is_cancelled():
+                    break
+                batch_done(_render_batch(batch, out_dir))
+        else:
+            _render_parallel(batches, out_dir, min(workers or os.cpu_count() or 1, len(batches)),
+                             batch_done, collect, is_cancelled)
+    except BaseException:
+        for path in set(done) | {dossier_path(out_dir, dossier) for dossier in dossiers} - existing:
+            if os.path.exists(path):
+                os.remove(path)
+        raise
+    for error in errors:
+        logging.warning("ملف PDF: %s", error)
+    _log_shaping_stats(shaping_stats)
+    return done, errors
+
+
+def _render_parallel(batches, out_dir, workers, batch_done, collect, is_cancelled):
+    pending = set()
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=register_fonts) as executor:
+            pending.update(executor.submit(_render_batch, batch, out_dir) for batch in batches)
+            try:
+                for future in as_completed(list(pending)):
+                    pending.discard(future)
+                    batch_done(future.result())
+                    if is_cancelled and is_cancelled():
+                        break
+            finally:
+                for future in pending:
+                    future.cancel()
+    finally:
+        # الدفعات التي كانت قيد التنفيذ عند الإلغاء أو الخطأ تكتمل قبل إغلاق الـ executor
+        for future in pending:
+            if not future.cancelled() and future.exception() is None:
+                collect(future.result())
+
+
+def _log_shaping_stats(shaping_stats):
+    hits = sum(stats["hits"] for stats in shaping_stats.values())
+    misses = sum(stats["misses"] for stats in shaping_stats.values())
+    if hits + misses:
+        logging.info(
+            "تشكيل النص: %d من %d من الذاكرة (%.1f%%) في %d عملية",
+            hits, hits + misses, hits / (hits + misses) * 100, len(shaping_stats)
+        )